@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from decimal import Decimal, localcontext
+import numpy as np
+from PIL import Image
+from core import batch, color_map, fractal, perturbation
+
+# 描画の各段階（脱出値の計算、正規化、色付け、画像への変換）の速さを決まった場面で測るベンチマーク
+# 結果はJSONに書き出し、compare で保存しておいた基準と比べて遅くなった段階があれば終了コード1を返す
+
+FORMAT_VERSION = 1 # 結果のJSONの形式（変えたら基準を取り直す）
+COLORS = ("#0000FF", "#FFFFFF") # MainWindowの初期の色
+
+def _rabbit_beta(): # --- 深い拡大の場面の中心（c = -0.123+0.745i の反発的な不動点 (1 + √(1-4c)) / 2）を高精度で返す関数 ---
+    with localcontext() as ctx:
+        ctx.prec = 60
+        a, b = 1 - 4 * Decimal(-0.123), -4 * Decimal(0.745)
+        r = (a * a + b * b).sqrt()
+        return (1 + ((r + a) / 2).sqrt()) / 2, -((r - a) / 2).sqrt() / 2
+
+def _deep_view(width): # --- 深い拡大の場面のビュー（16:9）をDecimalで返す関数 ---
+    x, y = _rabbit_beta()
+    with localcontext() as ctx:
+        ctx.prec = 60
+        w = Decimal(width) / 2
+        return (x - w, x + w, y - w * 9 / 16, y + w * 9 / 16)
+
+def scenarios(): # --- 測定する場面の一覧を返す関数（名前 → パラメータ。名前と内容を変えると基準と比べられなくなる） ---
+    # 初期のc（内部のない集合）。ビューはMainWindowの初期ビュー (-2, 2, -2, 2) の高さを16:9に合わせたもの
+    # （MainWindowは正方形のビューを1280x720に引き伸ばして表示するが、ベンチマークはどの解像度でも正方形のピクセルで測る）
+    default = {'view': (-2.0, 2.0, -1.125, 1.125), 'real': -0.4, 'imag': 0.6}
+    result = {}
+    for max_iter in (100, 300, 1000): # 反復回数を変える
+        result[f'default-1280x720-{max_iter}'] = dict(default, size=(1280, 720), max_iter=max_iter)
+    for width, height in ((640, 360), (1920, 1080)): # 解像度を変える（1280x720は上で測る）
+        result[f'default-{width}x{height}-300'] = dict(default, size=(width, height), max_iter=300)
+    # ほとんどが内部のビュー（basilicaの中央の成分）
+    result['interior-1280x720-1000'] = {'view': (-0.5, 0.5, -0.28125, 0.28125), 'real': -1.0, 'imag': 0.0, 'size': (1280, 720), 'max_iter': 1000}
+    # 境界を拡大したビュー（float64で計算できる深さ）
+    result['boundary-1280x720-1000'] = {'view': (0.2, 0.4, -0.2, -0.0875), 'real': -0.123, 'imag': 0.745, 'size': (1280, 720), 'max_iter': 1000}
+    # complex64 で計算した場合（上の同じビューの complex128 と比べる）
+    for name in ('default-1280x720-300', 'boundary-1280x720-1000'):
+        result[f'{name}-complex64'] = dict(result[name], precision='complex64')
+    # float64では表せない深さ（摂動法）
+    result['deep-640x360-1000'] = {'deep_view': _deep_view('1e-20'), 'real': -0.123, 'imag': 0.745, 'size': (640, 360), 'max_iter': 1000}
+    return result
+
+def _kernel(scenario, renderer, stats, workspace=None): # --- 正規化前の脱出値を計算する段階（renderer が None なら同じプロセスで workspace を使って計算する） ---
+    width, height = scenario['size']
+    c = complex(scenario['real'], scenario['imag'])
+    if 'deep_view' in scenario:
+        return perturbation.perturbation_values(scenario['deep_view'], width, height, c, scenario['max_iter'], stats=stats)
+    job = batch.make_job(view=scenario['view'], width=width, height=height, real=scenario['real'], imag=scenario['imag'], max_iter=scenario['max_iter'],
+                         precision=scenario.get('precision', 'complex128'))
+    return batch.render_raw(job, renderer, stats, workspace)
+
+def _photo_stage(): # --- Tkが使えればPhotoImageへの貼り付けの段階を返す関数（ディスプレイがなければNone） ---
+    try:
+        import tkinter as tk
+        from PIL import ImageTk
+        root = tk.Tk()
+    except Exception: # tkinterがないか、ディスプレイがない
+        return None
+    root.withdraw()
+    photos = {}
+    def paste(img): # MainWindow._poll_frame と同じく、作っておいたPhotoImageの画素を書き換える
+        if img.size not in photos:
+            photos[img.size] = ImageTk.PhotoImage('RGB', img.size)
+        photos[img.size].paste(img)
+    return paste
+
+MIN_MEASURE_SECONDS = 0.2 # 短い段階は合計がこの時間になるまで繰り返す（数msの段階は1回ごとのぶれが大きい）
+
+def _measure(func, repeat, prepare=None): # --- func を繰り返し実行した最短時間と中央値（秒）と、別に1回実行したときのピークメモリ（バイト）を返す関数 ---
+    # 少なくとも repeat 回、合計が MIN_MEASURE_SECONDS になるまで繰り返す
+    # prepare は毎回の実行前に呼ぶ（時間に含めない）。戻り値が func の引数になる
+    times = []
+    while len(times) < repeat or sum(times) < MIN_MEASURE_SECONDS:
+        args = prepare() if prepare else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    args = prepare() if prepare else ()
+    tracemalloc.start() # NumPyの配列の確保も記録される（測定時間が延びるので時間とは別に測る）
+    try:
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), float(np.median(times)), peak
+
+def run_scenario(scenario, repeat=5, renderer=None, photo=None): # --- 1つの場面の各段階を測定し、段階名 → 結果の辞書を返す関数 ---
+    # renderer は run が作って使い回す（プロセスプールの起動を測定時間に含めない）
+    width, height = scenario['size']
+    pixels = width * height
+    results = {}
+    stats = {}
+    workspace = fractal.Workspace() # 場面ごとに新しく作り、この場面で確保したバッファの大きさを記録する
+    raw = _kernel(scenario, renderer, stats, workspace) # 計算量を数え、後の段階の入力を作る（測定前の準備運転も兼ねる）
+    seconds, median, peak = _measure(lambda: _kernel(scenario, renderer, None, workspace), repeat)
+    results['kernel'] = {'seconds': seconds, 'median_seconds': median,
+                         'pixel_iterations': stats.get('pixel_iterations', 0),
+                         'pixel_iterations_per_s': stats.get('pixel_iterations', 0) / seconds, 'pixels_per_s': pixels / seconds}
+    if renderer is None or 'deep_view' in scenario: # tracemallocはこのプロセスしか数えないので、ワーカーで計算した場合はピークメモリを記録しない
+        results['kernel']['peak_bytes'] = peak
+    if renderer is None and 'deep_view' not in scenario: # 使い回す作業用バッファは準備運転で確保済みなのでピークメモリに入らない。別に記録する
+        results['kernel']['workspace_bytes'] = workspace.nbytes()
+    bounds = fractal.escape_bounds(raw)
+    values = fractal.normalize(raw.copy(), bounds)
+    colorizer = color_map.Colorizer() # MainWindowと同じくバッファを使い回す
+    colors = colorizer.colorize(values, COLORS).copy() # バッファを確保しておく
+    img = Image.fromarray(colors)
+    stages = [
+        ('normalize', lambda v: fractal.normalize(v, bounds), lambda: (raw.copy(),)),
+        ('colormap', lambda: colorizer.colorize(values, COLORS), None),
+        ('image', lambda: Image.fromarray(colors), None),
+    ]
+    if photo is not None: # ディスプレイがある場合だけTkへの貼り付けを測る
+        photo(img)
+        stages.append(('photo', lambda: photo(img), None))
+    for name, func, prepare in stages:
+        seconds, median, peak = _measure(func, repeat, prepare)
+        results[name] = {'seconds': seconds, 'median_seconds': median, 'peak_bytes': peak, 'pixels_per_s': pixels / seconds}
+    return results
+
+def run(names=None, repeat=5, workers=1, log=None): # --- 場面を順に測定して、JSONに書き出す辞書を返す関数 ---
+    selected = scenarios()
+    if names: # 指定した場面だけを測る
+        unknown = set(names) - set(selected)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {sorted(unknown)}, expected some of {sorted(selected)}")
+        selected = {name: selected[name] for name in names}
+    photo = _photo_stage()
+    renderer = None
+    if workers > 1: # 全ての場面で同じプロセスプールを使う
+        from core.tile_renderer import TileRenderer
+        renderer = TileRenderer(workers)
+    report = {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'workers': workers,
+        'scenarios': {}
+    }
+    try:
+        for name, scenario in selected.items():
+            report['scenarios'][name] = run_scenario(scenario, repeat, renderer, photo)
+            if log is not None:
+                for stage, result in report['scenarios'][name].items():
+                    print(format_result(name, stage, result), file=log, flush=True)
+    finally:
+        if renderer is not None:
+            renderer.close()
+    return report
+
+def format_result(name, stage, result): # --- 1つの段階の結果を1行の文字列にする関数 ---
+    memory = f"{result['peak_bytes'] / 2**20:8.1f} MB" if 'peak_bytes' in result else f"{'-':>8} MB" # ワーカーで計算した段階はピークメモリがない
+    line = f"{name:<24} {stage:<10} {result['seconds'] * 1000:9.1f} ms {memory}"
+    if 'pixel_iterations_per_s' in result:
+        line += f" {result['pixel_iterations_per_s'] / 1e6:9.1f} Mpix-it/s"
+    if 'workspace_bytes' in result:
+        line += f" {result['workspace_bytes'] / 2**20:8.1f} MB workspace"
+    return line
+
+def compare(baseline, current, threshold=0.25, memory_threshold=0.25, min_delta=0.002): # --- 基準と比べて遅くなった（メモリが増えた）段階の一覧を返す関数 ---
+    # 時間は threshold、ピークメモリは memory_threshold の割合を超えて増えたら後退とみなす
+    # 時間の差が min_delta 秒未満の段階は誤差とみなす（1ms程度の段階は測定のぶれの方が大きい）
+    # 基準にあって今回の結果にない場面や段階は 'MISSING' として後退に数える（場面を減らしてもゲートを通らないように）
+    # どちらかにピークメモリがない段階（--workers 2 以上で測った計算の段階）はメモリを比べない
+    rows, regressions = [], []
+    for name, stages in baseline['scenarios'].items():
+        for stage in stages:
+            if stage not in current['scenarios'].get(name, {}):
+                rows.append((name, stage, None, None, 'MISSING'))
+                regressions.append((name, stage, 'MISSING'))
+    for name, stages in current['scenarios'].items():
+        for stage, result in stages.items():
+            base = baseline['scenarios'].get(name, {}).get(stage)
+            if base is None: # 基準にない場面や段階は比べない
+                rows.append((name, stage, None, None, 'new'))
+                continue
+            ratio = result['seconds'] / base['seconds']
+            memory_ratio = None
+            if 'peak_bytes' in result and 'peak_bytes' in base:
+                memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+            status = 'ok'
+            if ratio > 1 + threshold and result['seconds'] - base['seconds'] > min_delta:
+                status = 'SLOWER'
+            elif memory_ratio is not None and memory_ratio > 1 + memory_threshold:
+                status = 'MEMORY'
+            if status != 'ok':
+                regressions.append((name, stage, status))
+            rows.append((name, stage, ratio, memory_ratio, status))
+    return rows, regressions
+
+def build_parser(): # --- コマンドライン引数の解析器を作る関数 ---
+    parser = argparse.ArgumentParser(description="描画の各段階の速さを決まった場面で測る")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench = commands.add_parser('run', help="場面を測定して結果をJSONに書き出す")
+    bench.add_argument('-o', '--output', default=None, help="結果を書き出すJSONファイル（既定は標準出力）")
+    bench.add_argument('--scenario', action='append', default=None, help="測定する場面（繰り返し指定できる。既定はすべて）")
+    bench.add_argument('--repeat', type=int, default=5, help="各段階の最少の実行回数（最短時間を使う。短い段階は合計0.2秒になるまで繰り返す）")
+    bench.add_argument('--workers', type=int, default=1, help="脱出値の計算に使うプロセス数（1なら同じプロセスで計算する。2以上では計算の段階のピークメモリを記録しない）")
+    bench.add_argument('--list', action='store_true', help="場面の一覧を表示して終わる")
+
+    check = commands.add_parser('compare', help="基準の結果と比べ、遅くなった段階や基準にあって今回ない段階があれば終了コード1を返す")
+    check.add_argument('baseline', help="基準の結果のJSONファイル")
+    check.add_argument('current', help="比べる結果のJSONファイル")
+    check.add_argument('--threshold', type=float, default=0.25, help="時間が何割増えたら後退とみなすか")
+    check.add_argument('--memory-threshold', type=float, default=0.25, help="ピークメモリが何割増えたら後退とみなすか")
+    check.add_argument('--min-delta', type=float, default=0.002, help="これより小さい時間の差（秒）は無視する")
+    return parser
+
+def main(argv=None): # --- コマンドラインから実行されたときの処理 ---
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == 'run':
+            if args.list:
+                for name in scenarios():
+                    print(name)
+                return 0
+            report = run(args.scenario, args.repeat, args.workers, log=sys.stderr)
+            text = json.dumps(report, indent=2)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(text + '\n')
+            else:
+                print(text)
+            return 0
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+        if baseline.get('version') != current.get('version'):
+            raise ValueError(f"Result format differs: {baseline.get('version')} vs {current.get('version')}")
+        rows, regressions = compare(baseline, current, args.threshold, args.memory_threshold, args.min_delta)
+        for name, stage, ratio, memory_ratio, status in rows:
+            if ratio is None:
+                print(f"{name:<24} {stage:<10} {'':>8} {'':>8}  {status}")
+            else:
+                memory = f"{memory_ratio:7.2f}x" if memory_ratio is not None else f"{'-':>8}"
+                print(f"{name:<24} {stage:<10} {ratio:7.2f}x {memory}  {status}")
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed", file=sys.stderr)
+            return 1
+    except (OSError, ValueError, KeyError) as e: # 入力の誤りはメッセージだけを表示する
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__": # もし、このファイルが直接実行されたときは、次を実行する
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import json
+import math
+import os
+import queue
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation, localcontext
+import numpy as np
+from PIL import Image
+from core import batch, color_map, fractal, frame_shift, perturbation
+from core.tile_renderer import process_workspace
+
+# キーフレームからアニメーションの各フレームを描画する（ウィンドウを使わない）
+# 計算（プロセスプール）、色付け（スレッド）、書き出し（スレッド）の3段をキューでつなぎ、先のフレームの計算と前のフレームの書き出しを重ねる
+# 隣り合うフレームで結果が変わらない部分は計算し直さない:
+#   same   ... ビュー、c、最大反復回数が前のフレームと同じ（計算も色付けもせずに前の画像をもう一度書き出す）
+#   shift  ... 拡大率が同じで整数ピクセルだけ平行移動した（frame_shift で前の脱出値をずらし、新しく見える行と列だけを計算する）
+#   deepen ... ビューと c が同じで最大反復回数だけが増えた（発散済みのピクセルの脱出値は変わらないので、値0のピクセルだけを計算する）
+
+CHAIN_LENGTH = 8 # 前のフレームを使って計算するフレームを1つのワーカーにまとめる数の上限（結果の配列をまとめて返すので大きくしすぎない）
+DEFAULT_AHEAD = 4 # 計算を先に進めてよいチェーンの数（キューの長さも同じ）
+PATTERN_EXAMPLE = 'frames/%05d.png' # PNGの連番の出力先の例
+_DONE = object() # キューの終わりの印
+_REPEAT = object() # 前のフレームと同じ画像（same）の印
+
+def exact_digits(values): # --- Decimal の値どうしを桁を落とさずに足し引きできる桁数を返す関数 ---
+    return max(28, max(v.adjusted() for v in values) - min(v.as_tuple().exponent for v in values) + 2)
+
+def span_digits(span, size): # --- 幅と高さが span のビューの座標の計算に必要な桁数を返す関数（perturbation.precision と同じ規則） ---
+    step = min(span[0] / (size[0] - 1), span[1] / (size[1] - 1)) # 1ピクセルの幅
+    return max(28, perturbation.GUARD_DIGITS - math.floor(step.log10()))
+
+def _decimal(value, name): # --- キーフレームの座標を Decimal に直す関数（数でなければValueError） ---
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)): # Decimal は前のキーフレームから引き継いだ値
+        raise ValueError(f"Expected a number for keyframe {name}, got {value!r}")
+    try:
+        return Decimal(str(value)) # float を経由しないように文字列から作る
+    except InvalidOperation:
+        raise ValueError(f"Expected a number for keyframe {name}, got {value!r}") from None
+
+def parse_keyframe(entry, previous, size): # --- キーフレームの辞書を (中心, 幅と高さ, c, 最大反復回数) に直す関数 ---
+    # ビューは 'view': [x_min, x_max, y_min, y_max] か、'center': [x, y] と 'width'（高さは画像の縦横比から決める）で指定する
+    # 深い拡大の座標は文字列で書けば桁を落とさない。省略したパラメータは前のキーフレームの値を使う
+    if not isinstance(entry, dict):
+        raise ValueError(f"Expected a keyframe object, got {entry!r}")
+    if not isinstance(entry.get('frame'), int) or entry['frame'] < 0:
+        raise ValueError(f"Keyframe needs a non-negative integer 'frame', got {entry.get('frame')!r}")
+    unknown = set(entry) - {'frame', 'view', 'center', 'width', 'real', 'imag', 'max_iter'}
+    if unknown:
+        raise ValueError(f"Unknown keyframe keys: {sorted(unknown)}")
+    key = dict(previous or {}, frame=entry['frame'])
+    if 'view' in entry:
+        if not isinstance(entry['view'], list):
+            raise ValueError(f"Expected view (x_min, x_max, y_min, y_max), got {entry['view']!r}")
+        view = [_decimal(v, 'view') for v in entry['view']]
+        if len(view) != 4 or view[1] <= view[0] or view[3] <= view[2]:
+            raise ValueError(f"Expected view (x_min, x_max, y_min, y_max), got {entry['view']}")
+        with localcontext() as ctx:
+            ctx.prec = exact_digits(view)
+            key['center'] = ((view[0] + view[1]) / 2, (view[2] + view[3]) / 2)
+            key['span'] = (view[1] - view[0], view[3] - view[2])
+    elif 'center' in entry or 'width' in entry:
+        center = entry.get('center', key.get('center', ()))
+        if not isinstance(center, (list, tuple)):
+            raise ValueError(f"Expected center [x, y], got {center!r}")
+        center = [_decimal(v, 'center') for v in center]
+        width = _decimal(entry['width'], 'width') if 'width' in entry else key.get('span', (None,))[0]
+        if len(center) != 2 or width is None or width <= 0:
+            raise ValueError(f"Expected center [x, y] and a positive width, got {entry.get('center')}, {entry.get('width')}")
+        key['center'] = tuple(center)
+        key['span'] = (width, width * (size[1] - 1) / (size[0] - 1)) # ピクセルが正方形になる高さ
+    for name, kind in (('real', float), ('imag', float), ('max_iter', int)):
+        if name in entry:
+            try:
+                key[name] = kind(entry[name])
+            except TypeError:
+                raise ValueError(f"Expected a number for keyframe {name}, got {entry[name]!r}") from None
+    missing = {'center', 'real', 'imag', 'max_iter'} - set(key)
+    if missing:
+        raise ValueError(f"First keyframe must set {sorted(missing)}")
+    if key['max_iter'] < 1:
+        raise ValueError(f"Expected max_iter >= 1, got {key['max_iter']}")
+    key['digits'] = span_digits(key['span'], size)
+    return key
+
+def load_animation(path): # --- アニメーションのファイル（JSON）を読み込み、(描画の設定, キーフレームのリスト) を返す関数 ---
+    # 描画の設定は batch のジョブと同じ名前（width, height, colors, cyclic, cycles, solver, precision）。キーフレームは 'keyframes' のリスト
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict) or not isinstance(spec.get('keyframes'), list) or not spec['keyframes']:
+        raise ValueError(f"{path}: expected a JSON object with a non-empty 'keyframes' list")
+    settings = {key: value for key, value in spec.items() if key != 'keyframes'}
+    if set(settings) - {'width', 'height', 'colors', 'cyclic', 'cycles', 'solver', 'precision'}:
+        raise ValueError(f"{path}: unknown keys {sorted(set(settings) - {'width', 'height', 'colors', 'cyclic', 'cycles', 'solver', 'precision'})}")
+    job = batch.make_job(**settings) # 大きさ、色、計算方式、精度の検証は描画ジョブと同じ
+    keyframes = []
+    for entry in spec['keyframes']:
+        keyframes.append(parse_keyframe(entry, keyframes[-1] if keyframes else None, (job['width'], job['height'])))
+        if len(keyframes) > 1 and keyframes[-1]['frame'] <= keyframes[-2]['frame']:
+            raise ValueError(f"{path}: keyframe frames must increase, got {keyframes[-2]['frame']} then {keyframes[-1]['frame']}")
+    return job, keyframes
+
+def interpolate(a, b, frame, size): # --- 2つのキーフレームの間のフレームのビュー（Decimal）、c、最大反復回数を返す関数 ---
+    # 幅と高さは対数で補間する（1フレームあたりの拡大率が一定になる）。中心は前後のビューを写す相似変換の不動点を中心に拡大するように動かす
+    # （拡大率が変わらない区間では中心を1ピクセル単位に揃えて、前のフレームを平行移動して使えるようにする）
+    t = Decimal(frame - a['frame']) / (b['frame'] - a['frame'])
+    with localcontext() as ctx:
+        ctx.prec = max(a['digits'], b['digits'])
+        (ax, ay), (bx, by) = a['center'], b['center']
+        if a['span'][0] == b['span'][0]: # 平行移動だけの区間
+            step_x = a['span'][0] / (size[0] - 1) # 1ピクセルの幅
+            step_y = a['span'][1] / (size[1] - 1)
+            span = a['span']
+            center = (ax + ((bx - ax) * t / step_x).to_integral_value() * step_x,
+                      ay + ((by - ay) * t / step_y).to_integral_value() * step_y)
+        else:
+            span = tuple(sa * (sb / sa) ** t for sa, sb in zip(a['span'], b['span'])) # sa × (sb/sa)^t
+            f = (span[0] - a['span'][0]) / (b['span'][0] - a['span'][0]) # 中心が動く割合（幅の変化に比例させる）
+            center = (ax + (bx - ax) * f, ay + (by - ay) * f)
+        view = view_of({'center': center, 'span': span})
+    u = float(t)
+    return {
+        'view': view,
+        'c': complex(a['real'] + (b['real'] - a['real']) * u, a['imag'] + (b['imag'] - a['imag']) * u),
+        'max_iter': int(round(a['max_iter'] + (b['max_iter'] - a['max_iter']) * u)),
+    }
+
+def view_of(key): # --- 中心と幅と高さから (x_min, x_max, y_min, y_max) を返す関数（現在の decimal の桁数で計算する） ---
+    (cx, cy), (sx, sy) = key['center'], key['span']
+    return (cx - sx / 2, cx + sx / 2, cy - sy / 2, cy + sy / 2)
+
+def frame_axes(frame, size): # --- float64 で計算できるフレームの各ピクセルのx座標とy座標を返す関数 ---
+    view = [float(v) for v in frame['view']]
+    return np.linspace(view[0], view[1], size[0]), np.linspace(view[2], view[3], size[1])
+
+def classify(previous, frame, size, precision='complex128'): # --- 前のフレームの結果を使えるかを調べ、frame に 'reuse' と 'shift' と 'precision' を書き込む関数 ---
+    frame['reuse'] = None
+    frame['precision'] = fractal.select_precision(precision, frame['view'], size) # 拡大して complex128 に切り替わったフレームは前の結果を使わない
+    if previous is None or previous['precision'] != frame['precision']:
+        return frame
+    if previous['view'] == frame['view'] and previous['c'] == frame['c']:
+        if previous['max_iter'] == frame['max_iter']:
+            frame['reuse'] = 'same'
+        elif previous['max_iter'] < frame['max_iter'] and not perturbation.needs_perturbation(frame['view'], size):
+            frame['reuse'] = 'deepen' # 反復回数を減らした場合は発散済みのピクセルも値0に変わるので使わない
+        return frame
+    if perturbation.needs_perturbation(previous['view'], size) or perturbation.needs_perturbation(frame['view'], size):
+        return frame # 摂動法のフレームは座標を float64 で比べられない
+    old_x, old_y = frame_axes(previous, size)
+    x, y = frame_axes(frame, size)
+    shift = frame_shift.pixel_shift({'x': old_x, 'y': old_y, 'c': previous['c'], 'max_iter': previous['max_iter']},
+                                    x, y, frame['c'], frame['max_iter'])
+    if shift is not None:
+        frame['reuse'], frame['shift'] = 'shift', shift
+    return frame
+
+def frame_plan(keyframes, size, precision='complex128'): # --- キーフレームを補間した全フレームのリストを返す関数（各フレームは前のフレームとの関係も持つ） ---
+    if len(keyframes) == 1: # 1枚だけの静止画
+        key = keyframes[0]
+        with localcontext() as ctx:
+            ctx.prec = key['digits']
+            view = view_of(key)
+        return [classify(None, {'view': view, 'c': complex(key['real'], key['imag']), 'max_iter': key['max_iter']}, size, precision)]
+    plan = []
+    for a, b in zip(keyframes, keyframes[1:]):
+        last = b is keyframes[-1]
+        for frame in range(a['frame'], b['frame'] + (1 if last else 0)): # 区間の終わりは次の区間の始まりと同じフレーム
+            plan.append(classify(plan[-1] if plan else None, interpolate(a, b, frame, size), size, precision))
+    return plan
+
+def chains(plan, max_length=CHAIN_LENGTH): # --- same 以外のフレームを、前のフレームを使うフレームが続くかぎり max_length 個までまとめる関数 ---
+    groups = []
+    for frame in plan:
+        if frame['reuse'] == 'same': # 計算しない
+            continue
+        if frame['reuse'] is None or not groups or len(groups[-1]) >= max_length:
+            frame = dict(frame, reuse=None) # チェーンの先頭は前のフレームがないので最初から計算する
+            groups.append([])
+        groups[-1].append(frame)
+    return groups
+
+def compute_frame(frame, size, solver='active', base=None, stats=None): # --- 1つのフレームの正規化前の脱出値を計算する関数 ---
+    # base は前のフレームの脱出値（frame['reuse'] が 'shift' か 'deepen' のときに使う）
+    width, height = size
+    if perturbation.needs_perturbation(frame['view'], size): # float64 では表せないほど拡大したフレーム
+        return perturbation.perturbation_values(frame['view'], width, height, frame['c'], frame['max_iter'], stats=stats)
+    x, y = frame_axes(frame, size)
+    raw = np.zeros((height, width), dtype=np.float32)
+    known = np.zeros(raw.shape, dtype=bool)
+    if base is not None and frame['reuse'] == 'shift': # 前の脱出値をずらして、新しく見える行と列だけを計算する
+        raw[:] = base
+        frame_shift.shift_frame(raw, known, *frame['shift'])
+    elif base is not None and frame['reuse'] == 'deepen': # 発散済みのピクセルはそのまま使う
+        raw[:] = base
+        np.greater(raw, 0, out=known)
+    fractal.fill_escape_values(raw, known, x, y, frame['c'], frame['max_iter'], solver=solver, stats=stats,
+                               precision=frame['precision'], workspace=process_workspace()) # フレームの大きさは同じなので作業用のバッファを使い回す
+    return raw
+
+def render_chain(frames, size, solver='active'): # --- ワーカープロセスで1つのチェーンを順に計算し、(脱出値のリスト, 計算量) を返す関数 ---
+    stats = {}
+    raws = []
+    for frame in frames:
+        raws.append(compute_frame(frame, size, solver, raws[-1] if raws else None, stats))
+    return raws, stats
+
+def colorize_frame(raw, job, colorizer): # --- 脱出値を正規化して色付けしたRGBの配列を返す関数（書き出しのスレッドに渡すのでコピーする） ---
+    output = fractal.normalize(raw, fractal.escape_bounds(raw)) # その場で書き換える（脱出値は使い終わっている）
+    return colorizer.colorize(output, job['colors'], job['cyclic'], job['cycles']).copy()
+
+class PngSequence: # --- フレームをPNGの連番で書き出すクラス ---
+    def __init__(self, pattern): # --- PngSequenceクラスのコンストラクタの定義（pattern は '%05d' などで番号を入れるパス） ---
+        try:
+            pattern % 0
+        except TypeError:
+            raise ValueError(f"PNG output needs a frame number field like {PATTERN_EXAMPLE!r}, got {pattern!r}")
+        self.pattern = pattern
+        self.count = 0
+
+    def write(self, rgb): # --- 1フレームを書き出すメソッド ---
+        batch.save_image(Image.fromarray(rgb), self.pattern % self.count) # 途中で止まっても書きかけのファイルを残さない
+        self.count += 1
+
+    def close(self):
+        pass
+
+class RawVideo: # --- フレームを rgb24 の生の映像としてファイル、標準出力、または外部コマンドの標準入力に書き出すクラス ---
+    # 例: --pipe "ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - out.mp4"
+    def __init__(self, path=None, command=None): # --- RawVideoクラスのコンストラクタの定義（path が '-' なら標準出力） ---
+        self.process = None
+        if command is not None:
+            self.process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE)
+            self.stream = self.process.stdin
+        elif path == '-':
+            self.stream = sys.stdout.buffer
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.stream = open(path, 'wb')
+        self.count = 0
+
+    def write(self, rgb): # --- 1フレームを書き出すメソッド ---
+        self.stream.write(memoryview(np.ascontiguousarray(rgb)).cast('B')) # コピーせずに書き出す
+        self.count += 1
+
+    def close(self): # --- 出力を閉じ、外部コマンドの終了を待つメソッド ---
+        if self.stream is sys.stdout.buffer:
+            self.stream.flush()
+            return
+        self.stream.close()
+        if self.process is not None and self.process.wait() != 0:
+            raise OSError(f"Pipe command exited with status {self.process.returncode}")
+
+def open_encoder(output=None, pipe=None): # --- 出力先に合わせた書き出し用のオブジェクトを返す関数 ---
+    # pipe を指定すれば外部コマンドへ、output が .png なら連番のPNG、'-' なら標準出力、それ以外はファイルへ rgb24 で書き出す
+    if pipe is not None:
+        return RawVideo(command=pipe)
+    if output is None:
+        raise ValueError("Give an output path or a pipe command")
+    if os.path.splitext(output)[1].lower() == '.png':
+        return PngSequence(output)
+    return RawVideo(output)
+
+def _stage(func, inbox, outbox, errors): # --- キューから受け取った値を func で変換して次のキューへ渡すスレッドの本体 ---
+    # 失敗したら errors に例外を記録し、前の段が止まらないように残りを読み捨てる
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            break
+        if errors:
+            continue
+        try:
+            result = func(item)
+        except BaseException as e:
+            errors.append(e)
+            continue
+        if outbox is not None:
+            outbox.put(result)
+    if outbox is not None:
+        outbox.put(_DONE)
+
+def _computed(groups, job, workers, ahead, stats): # --- チェーンを先に ahead 個まで計算に出し、脱出値をフレームの順に返すジェネレータ ---
+    size = (job['width'], job['height'])
+    if workers <= 1: # 同じプロセスで計算する（色付けと書き出しはスレッドで重なる）
+        for frames in groups:
+            raws, chain_stats = render_chain(frames, size, job['solver'])
+            fractal.merge_stats(stats, chain_stats)
+            yield from raws
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        groups = iter(groups)
+        try:
+            while True:
+                while len(pending) < ahead: # 計算中のチェーンを補充する
+                    frames = next(groups, None)
+                    if frames is None:
+                        break
+                    pending.append(executor.submit(render_chain, frames, size, job['solver']))
+                if not pending:
+                    return
+                raws, chain_stats = pending.popleft().result() # 順番に受け取る（ワーカーの例外はここで再送出される）
+                fractal.merge_stats(stats, chain_stats)
+                yield from raws
+        finally:
+            for future in pending: # 途中で止めたら残りを取り消す
+                future.cancel()
+
+def render_animation(job, keyframes, output=None, pipe=None, workers=None, ahead=DEFAULT_AHEAD, stats=None): # --- キーフレームからアニメーションを描画して書き出し、フレーム数を返す関数 ---
+    # job は load_animation が返す描画の設定。stats に辞書を渡すと計算量と再利用したフレーム数（'same', 'shift', 'deepen'）を足し込む
+    workers = workers or os.cpu_count() or 1
+    stats = {} if stats is None else stats
+    size = (job['width'], job['height'])
+    plan = frame_plan(keyframes, size, job['precision'])
+    groups = chains(plan)
+    for group in groups:
+        for frame in group:
+            if frame['reuse'] is not None:
+                stats[frame['reuse']] = stats.get(frame['reuse'], 0) + 1
+    stats['same'] = stats.get('same', 0) + sum(frame['reuse'] == 'same' for frame in plan)
+    encoder = open_encoder(output, pipe)
+    colorizer = color_map.Colorizer() # 色付けのスレッドだけで使う
+    colored, encoded, errors = queue.Queue(ahead), queue.Queue(ahead), []
+    last = [None] # same のフレームで書き出す前の画像
+
+    def colorize(raw): # --- 色付けの段（same のフレームは前の画像を使う） ---
+        if raw is not _REPEAT:
+            last[0] = colorize_frame(raw, job, colorizer)
+        return last[0]
+
+    threads = [threading.Thread(target=_stage, args=(colorize, colored, encoded, errors), daemon=True),
+               threading.Thread(target=_stage, args=(encoder.write, encoded, None, errors), daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        raws = _computed(groups, job, workers, ahead, stats)
+        for frame in plan: # 計算の段（このスレッド）。キューがいっぱいなら後ろの段を待つ
+            if errors: # 後ろの段が失敗したら計算を打ち切る
+                break
+            colored.put(_REPEAT if frame['reuse'] == 'same' else next(raws))
+        raws.close()
+    finally:
+        colored.put(_DONE)
+        for thread in threads:
+            thread.join()
+        encoder.close()
+    if errors:
+        raise errors[0]
+    return len(plan)
@@ -0,0 +1,65 @@
+import numpy as np
+from core import fractal, color_map
+
+# 境界だけのアンチエイリアス
+# 隣のピクセルと脱出値が大きく違うピクセルだけを、ピクセル内でずらした点で追加計算して色を平均する
+
+EDGE_THRESHOLD = 1 / 64 # 隣のピクセルとの正規化済みの脱出値の差がこれを超えたら境界とみなす
+SAMPLES = 4 # 境界のピクセル1つあたりの追加サンプル数（平方数。ピクセルを格子に分け、各区画の中でずらす）
+DEFAULT_BUDGET = 0.25 # 追加サンプル数の上限（フレームのピクセル数に対する割合。SAMPLESなら全ピクセルを追加計算できる）
+
+def edge_contrast(values): # --- 各ピクセルと上下左右のピクセルの正規化済みの脱出値の差の最大値を返す関数 ---
+    contrast = np.zeros(values.shape, dtype=np.float32)
+    inside = values == 0 # 発散しないピクセル（値0）
+    for axis in (0, 1):
+        head = (slice(None),) * axis + (slice(1, None),) # 各ピクセルと1つ前のピクセル
+        tail = (slice(None),) * axis + (slice(None, -1),)
+        diff = np.abs(values[head] - values[tail])
+        diff[inside[head] != inside[tail]] = 1 # 集合の内側と外側の境目は値に関係なく境界にする
+        np.maximum(contrast[head], diff, out=contrast[head])
+        np.maximum(contrast[tail], diff, out=contrast[tail])
+    return contrast
+
+def select_edges(contrast, threshold, max_pixels): # --- 差が threshold を超えるピクセルのうち、差の大きい順に max_pixels 個までの平坦なインデックスを返す関数 ---
+    edges = np.flatnonzero(contrast > threshold)
+    if edges.size > max_pixels: # 上限を超えたら差の大きいピクセルを優先する
+        order = np.argpartition(contrast.flat[edges], edges.size - max_pixels)
+        edges = np.sort(edges[order[edges.size - max_pixels:]])
+    return edges
+
+def jitter_offsets(count, samples, rng): # --- ピクセルの中心からのずれ（ピクセル単位、-0.5～0.5）を (count, samples) の2つの配列で返す関数 ---
+    n = int(round(np.sqrt(samples))) # ピクセルを n×n の区画に分ける
+    cells = np.arange(n * n)
+    cell_x, cell_y = cells % n, cells // n # 各サンプルの区画
+    ox = (cell_x + rng.random((count, n * n))) / n - 0.5 # 区画の中でずらす（格子状の模様が出ないように）
+    oy = (cell_y + rng.random((count, n * n))) / n - 0.5
+    return ox, oy
+
+def antialias(colors, values, bounds, x, y, c, max_iter, colors_hex, cyclic=False, cycles=1,
+              budget=DEFAULT_BUDGET, samples=SAMPLES, threshold=EDGE_THRESHOLD, cancel=None, stats=None, seed=0,
+              precision='complex128', workspace=None): # --- 境界のピクセルだけを追加計算して色を平均する関数（colors をその場で書き換える） ---
+    # colors は values を colors_hex で色付けした (高さ, 幅, 3) の配列、values は bounds で正規化した脱出値、x, y は各ピクセルの座標
+    # 追加サンプル数は budget × ピクセル数まで。ずらし方は seed で決まるので、同じフレームは同じ画像になる（ちらつかない）
+    # precision と workspace は fractal.escape_values に渡す（フレームと同じ精度で計算し、フレームの作業用バッファを使い回す）
+    height, width = values.shape
+    max_pixels = int(budget * values.size / samples) # 追加計算できるピクセル数
+    if max_pixels <= 0 or bounds is None: # 上限が0か、発散したピクセルがない（境界がない）
+        return colors
+    contrast = edge_contrast(values)
+    if cyclic: # 周期的なパレットは値の差が cycles 倍の色の差になる
+        contrast *= cycles
+    edges = select_edges(contrast, threshold, max_pixels)
+    if edges.size == 0:
+        return colors
+    rows, cols = np.divmod(edges, width)
+    ox, oy = jitter_offsets(edges.size, samples, np.random.default_rng(seed))
+    step_x = (x[-1] - x[0]) / (width - 1) # 1ピクセルの幅
+    step_y = (y[-1] - y[0]) / (height - 1)
+    Z = (x[cols][:, np.newaxis] + ox * step_x) + 1j * (y[rows][:, np.newaxis] + oy * step_y) # (境界のピクセル数, サンプル数)
+    sub = fractal.normalize(fractal.escape_values(Z, c, max_iter, cancel, stats, precision=precision, workspace=workspace), bounds) # フレーム全体と同じ範囲で正規化する
+    sub_colors = color_map.Colorizer().colorize(sub, colors_hex, cyclic, cycles) # (境界のピクセル数, サンプル数, 3)
+    total = sub_colors.sum(axis=1, dtype=np.uint32) + colors[rows, cols] # ピクセルの中心の色も含めて平均する
+    colors[rows, cols] = (total + (ox.shape[1] + 1) // 2) // (ox.shape[1] + 1) # 四捨五入
+    if stats is not None:
+        stats['antialiased_pixels'] = stats.get('antialiased_pixels', 0) + int(edges.size)
+    return colors
@@ -0,0 +1,78 @@
+import numpy as np
+from core import color_map, fractal
+
+# パラメータ平面のアトラス（c を格子状に変えた小さなJulia集合のサムネイルを並べた画像）
+# すべてのサムネイルを (c の数, 高さ, 幅) の1つの配列にまとめ、サムネイルごとの c をブロードキャストして一度に反復する
+# 格子の行0が虚部の最小値、列0が実部の最小値（MainWindowのキャンバスと同じ向き）
+
+DEFAULT_PLANE = (-2.0, 0.5, -1.25, 1.25) # c の範囲 (実部の最小値, 最大値, 虚部の最小値, 最大値)（Mandelbrot集合を含む）
+DEFAULT_GRID = (32, 32) # サムネイルの (列数, 行数)
+DEFAULT_THUMB = 64 # サムネイルの一辺（ピクセル）
+DEFAULT_VIEW = (-2.0, 2.0, -2.0, 2.0) # 各サムネイルの表示範囲（MainWindowの初期ビューと同じ）
+DEFAULT_MAX_ITER = 100 # サムネイルの最大反復回数（小さな画像では細部が見えないので少なくてよい）
+BAND_ROWS = 4 # 一度に反復するアトラスの行数（32列×64ピクセルなら4行で約52万ピクセル。全体を一度に反復するより作業用の配列がキャッシュに収まって速い）
+GAP = 1 # サムネイルの間の隙間（ピクセル）
+GAP_COLOR = 255 # 隙間の色（白）
+
+def atlas_params(plane=DEFAULT_PLANE, grid=DEFAULT_GRID): # --- 格子の各セルの c を (行数, 列数) の複素数の配列で返す関数 ---
+    cols, rows = grid
+    real = np.linspace(plane[0], plane[1], cols)
+    imag = np.linspace(plane[2], plane[3], rows)
+    return real[np.newaxis, :] + 1j * imag[:, np.newaxis]
+
+def atlas_values(cs, view=DEFAULT_VIEW, thumb=DEFAULT_THUMB, max_iter=DEFAULT_MAX_ITER, cancel=None, stats=None): # --- c の並びのサムネイルの正規化前の脱出値を (c の数, thumb, thumb) の配列で返す関数 ---
+    Z = fractal.make_grid(*view, thumb, thumb) # 全サムネイルで共通の複素数グリッド
+    cs = np.ravel(cs)
+    stack = np.broadcast_to(Z, (cs.size,) + Z.shape) # (c の数, 高さ, 幅)（コピーしない）
+    return fractal.escape_values(stack, cs[:, np.newaxis, np.newaxis], max_iter, cancel, stats) # c はサムネイルごとに全ピクセルへブロードキャストする
+
+def atlas_band(cs, view, thumb, max_iter): # --- ワーカープロセスでアトラスの一部の行を計算し、(脱出値, 計算量) を返す関数 ---
+    stats = {}
+    return atlas_values(cs, view, thumb, max_iter, stats=stats), stats
+
+def normalize_stack(values): # --- 脱出値をサムネイルごとに0～1に正規化する関数（その場で書き換える） ---
+    positive = values > 0
+    low = np.where(positive, values, np.inf).min(axis=(1, 2), keepdims=True) # 発散したピクセルがないサムネイルは inf
+    high = np.where(positive, values, -np.inf).max(axis=(1, 2), keepdims=True)
+    scale = np.where(high > low, high - low, 1) # すべて同じ値なら0にする（fractal.normalize と同じ）
+    np.divide(values - low, scale, out=values, where=positive)
+    return values
+
+def atlas_image(values, grid, colors_hex, gap=GAP): # --- 正規化済みのサムネイルを色付けして格子状に並べたRGBの配列を返す関数 ---
+    cols, rows = grid
+    n, height, width = values.shape
+    colors = color_map.Colorizer().colorize(values.reshape(n * height, width), colors_hex).reshape(rows, cols, height, width, 3)
+    image = np.full((rows, height + gap, cols, width + gap, 3), GAP_COLOR, dtype=np.uint8) # 各サムネイルの右と下に隙間を付ける
+    image[:, :height, :, :width] = colors.transpose(0, 2, 1, 3, 4) # (行, 高さ, 列, 幅, 3) に並べ替える
+    return image.reshape(rows * (height + gap), cols * (width + gap), 3)[:-gap or None, :-gap or None] # 最後の隙間は付けない
+
+def cell_at(px, py, grid, thumb=DEFAULT_THUMB, gap=GAP): # --- アトラスの画像上の座標にあるサムネイルの (行, 列) を返す関数（隙間や画像の外ならNone） ---
+    col, x = divmod(int(px), thumb + gap)
+    row, y = divmod(int(py), thumb + gap)
+    if not (0 <= col < grid[0] and 0 <= row < grid[1]) or x >= thumb or y >= thumb:
+        return None
+    return row, col
+
+def render_atlas(cs, view=DEFAULT_VIEW, thumb=DEFAULT_THUMB, max_iter=DEFAULT_MAX_ITER, renderer=None, band_rows=BAND_ROWS, cancel=None, stats=None): # --- アトラスの正規化済みの値を計算する関数 ---
+    # cs は atlas_params が返す (行数, 列数) の配列。band_rows 行ずつ計算し、renderer に TileRenderer を渡せばバンドをワーカープロセスに分ける
+    rows, cols = cs.shape
+    if renderer is None or renderer.workers <= 1:
+        values = np.concatenate([atlas_values(cs[row0:row0 + band_rows], view, thumb, max_iter, cancel, stats)
+                                 for row0 in range(0, rows, band_rows)])
+    else:
+        futures = [renderer.submit(atlas_band, cs[row0:row0 + band_rows], view, thumb, max_iter)
+                   for row0 in range(0, rows, band_rows)]
+        try:
+            bands = []
+            for future in futures: # 行の順に受け取る
+                band, band_stats = future.result()
+                bands.append(band)
+                if stats is not None:
+                    fractal.merge_stats(stats, band_stats)
+                if cancel is not None and cancel():
+                    raise fractal.RenderCancelled()
+        finally:
+            for future in futures: # 取り消したら残りのバンドを計算しない
+                future.cancel()
+        values = np.concatenate(bands)
+    return normalize_stack(values)
@@ -0,0 +1,139 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
+from core import fractal, color_map, antialias, stream_render
+from core.tile_renderer import process_workspace
+
+# 描画ジョブの初期値（MainWindowの初期パラメータと同じ）
+DEFAULT_JOB = {
+    'view': (-2.0, 2.0, -2.0, 2.0), # (x_min, x_max, y_min, y_max)
+    'width': 1280,
+    'height': 720,
+    'real': -0.4,
+    'imag': 0.6,
+    'max_iter': 300,
+    'colors': ("#0000FF", "#FFFFFF"), # 2色以上のグラデーション
+    'cyclic': False, # 周期的なパレットにするかどうか
+    'cycles': 1, # 周期的なパレットの周回数
+    'solver': 'active', # 計算方式（fractal.SOLVERS のどれか）
+    'precision': 'complex128', # 計算の精度（fractal.PRECISIONS のどれか。complex64 でも深く拡大したビューは complex128 で計算する）
+    'antialias': 0.0 # 境界のアンチエイリアスの追加サンプル数の上限（ピクセル数に対する割合。0なら使わない、帯ごとの描画では使わない）
+}
+# 型を揃えるパラメータ（JSONで文字列が書かれていてもValueErrorにする）
+JOB_TYPES = {
+    'view': lambda view: tuple(float(v) for v in view),
+    'colors': tuple,
+    'width': int, 'height': int, 'max_iter': int, 'cycles': int,
+    'real': float, 'imag': float, 'antialias': float
+}
+DEFAULT_MAX_MEMORY = 1024 * 2**20 # 1ジョブの作業メモリの上限（これを超える画像は帯ごとに描画する）
+
+def make_job(**params): # --- 初期値に指定したパラメータを上書きして描画ジョブを作る関数 ---
+    unknown = set(params) - set(DEFAULT_JOB) - {'output'} # 知らないキーは書き間違いとみなす
+    if unknown:
+        raise ValueError(f"Unknown job keys: {sorted(unknown)}")
+    job = dict(DEFAULT_JOB, **params)
+    for key, convert in JOB_TYPES.items(): # 型の違う値（リストでないview、nullの数値など）もValueErrorにする
+        try:
+            job[key] = convert(job[key])
+        except TypeError:
+            raise ValueError(f"Invalid {key}: {job[key]!r}") from None
+    if len(job['view']) != 4:
+        raise ValueError(f"Expected view (x_min, x_max, y_min, y_max), got {job['view']}")
+    if len(job['colors']) < 2 or not all(isinstance(c, str) and color_map.is_valid_hex_color(c) for c in job['colors']):
+        raise ValueError(f"Expected two or more #RRGGBB colors, got {job['colors']}")
+    if job['solver'] not in fractal.SOLVERS:
+        raise ValueError(f"Unknown solver {job['solver']!r}, expected one of {fractal.SOLVERS}")
+    if job['precision'] not in fractal.PRECISIONS:
+        raise ValueError(f"Unknown precision {job['precision']!r}, expected one of {fractal.PRECISIONS}")
+    if job['antialias'] < 0:
+        raise ValueError(f"Expected antialias >= 0, got {job['antialias']}")
+    if job['width'] < 2 or job['height'] < 2 or job['max_iter'] < 1:
+        raise ValueError(f"Invalid size or max_iter: {job['width']}x{job['height']}, {job['max_iter']}")
+    return job
+
+def load_jobs(path): # --- ジョブファイル（JSONのリスト）を読み込む関数 ---
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a JSON list of jobs")
+    jobs = []
+    base = os.path.dirname(os.path.abspath(path)) # 出力先の相対パスはジョブファイルの場所から数える
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{path}: job {i} is not a JSON object")
+        if not isinstance(entry.get('output'), str):
+            raise ValueError(f"{path}: job {i} has no 'output' path")
+        job = make_job(**entry)
+        job['output'] = os.path.join(base, job['output'])
+        jobs.append(job)
+    return jobs
+
+def job_axes(job): # --- ジョブの各ピクセルのx座標とy座標を返す関数 ---
+    x = np.linspace(job['view'][0], job['view'][1], job['width']) # x軸の値を生成する
+    y = np.linspace(job['view'][2], job['view'][3], job['height']) # y軸の値を生成する
+    return x, y
+
+def job_precision(job): # --- ジョブの拡大率に応じて実際に使う精度を返す関数 ---
+    return fractal.select_precision(job['precision'], job['view'], (job['width'], job['height']))
+
+def render_raw(job, renderer=None, stats=None, workspace=None): # --- ジョブの正規化前の脱出値を計算する関数（workspace を省略するとプロセスの Workspace を使う） ---
+    x, y = job_axes(job)
+    c = complex(job['real'], job['imag'])
+    precision = job_precision(job)
+    if renderer is not None: # TileRendererがあれば行バンドを並列計算する
+        output = renderer.render_raw(x, y, c, job['max_iter'], solver=job['solver'], stats=stats, precision=precision)
+    else:
+        output = np.zeros((len(y), len(x)), dtype=np.float32) # 正規化前の脱出値
+        known = np.zeros(output.shape, dtype=bool) # 計算済みのピクセル
+        fractal.fill_escape_values(output, known, x, y, c, job['max_iter'], solver=job['solver'], stats=stats,
+                                   precision=precision, workspace=workspace or process_workspace()) # 続けて描画するジョブで作業用のバッファを使い回す
+    return output
+
+def render_image(job, renderer=None, stats=None): # --- ジョブを描画してPILの画像を返す関数 ---
+    raw = render_raw(job, renderer, stats)
+    bounds = fractal.escape_bounds(raw) # 境界の追加サンプルも同じ範囲で正規化する
+    output = fractal.normalize(raw, bounds)
+    colors = color_map.Colorizer().colorize(output, job['colors'], job['cyclic'], job['cycles']) # カラーマップの適用
+    if job['antialias'] > 0: # 境界のピクセルだけ追加計算して色を平均する
+        x, y = job_axes(job)
+        antialias.antialias(colors, output, bounds, x, y, complex(job['real'], job['imag']), job['max_iter'],
+                            job['colors'], job['cyclic'], job['cycles'], job['antialias'], stats=stats,
+                            precision=job_precision(job), workspace=process_workspace())
+    return Image.fromarray(colors)
+
+def save_image(img, path): # --- 画像を保存する関数（途中で止まっても書きかけのファイルが残らないようにする） ---
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.part{ext}" # 拡張子で形式が決まるので残しておく
+    img.save(tmp_path)
+    os.replace(tmp_path, path) # 書き終わってから名前を変える
+
+def run_job(job, force=False, max_memory=DEFAULT_MAX_MEMORY): # --- 1つのジョブを実行する関数（出力が既にあれば飛ばす） ---
+    if not force and os.path.exists(job['output']):
+        return job['output'], 'skipped'
+    if stream_render.fits_in_memory(job['width'], job['height'], max_memory): # メモリに収まる画像は一度に描画する
+        save_image(render_image(job), job['output'])
+    else: # 収まらない画像は帯ごとに描画してPNGに書き出す
+        stream_render.render_png(job, max_memory)
+    return job['output'], 'done'
+
+def run_jobs(jobs, workers=None, force=False, max_memory=DEFAULT_MAX_MEMORY): # --- ジョブを複数のプロセスで並列に実行し、終わった順に結果を返すジェネレータ ---
+    workers = workers or os.cpu_count() or 1
+    pending = [] # 描画するジョブ（出力が既にあるジョブはプロセスに渡さない）
+    for job in jobs:
+        if force or not os.path.exists(job['output']):
+            pending.append(job)
+        else:
+            yield job['output'], 'skipped'
+    if workers <= 1: # ワーカーが1つなら同じプロセスで実行する
+        for job in pending:
+            yield run_job(job, True, max_memory)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job, True, max_memory / workers) for job in pending] # 同時に動くジョブでメモリの上限を分け合う
+        for future in as_completed(futures):
+            yield future.result()
@@ -1,5 +1,7 @@
 import numpy as np
-from tkinter import colorchooser
+from functools import lru_cache
+
+LUT_SIZE = 4096 # ルックアップテーブルの色数（2のべき乗。4096なら計算式との差はRGB各1以内）
 
 def hex_to_rgb(hex_color): # --- 16進数カラーコードをRGB値に変換する関数 ---
     hex_color = hex_color.lstrip('#') # '#' を除去
@@ -14,27 +16,62 @@ def is_valid_hex_color(color): # --- 16進数カラーコードの形式を検
     except ValueError: # 変換できない場合はFalseを返す
         return False
 
-def create_colormap(values, start_color_hex, end_color_hex):  # --- 数値データからRGBカラーマップを生成 ---
-#def create_colormap(values, start_color_hex, end_color_hex, bg_color_hex):  # --- 数値データからRGBカラーマップを生成 ---
-    try:  # カラーコードをRGBに変換
-        start_rgb = hex_to_rgb(start_color_hex)  # 開始色
-        end_rgb = hex_to_rgb(end_color_hex)  # 終了色
-#        bg_rgb = hex_to_rgb(bg_color_hex)  # 背景色
+@lru_cache(maxsize=64)
+def build_lut(colors_hex, size=LUT_SIZE, cyclic=False): # --- 色の並び（複数可）からRGBのルックアップテーブルを作る関数（同じ色の組み合わせは使い回す） ---
+    rgbs = np.array([hex_to_rgb(color) for color in colors_hex], dtype=np.float64) # 各色をRGB値に変換
+    if cyclic: # 周期的なパレットは最後の色から最初の色へ戻る
+        rgbs = np.vstack([rgbs, rgbs[:1]])
+    stops = np.linspace(0, 1, len(rgbs)) # 各色の位置（等間隔）
+    positions = np.linspace(0, 1, size) # テーブルの各段階の位置
+    lut = np.empty((size, 3), dtype=np.uint8) # ルックアップテーブル
+    for i in range(3): # RGBの各成分（赤、緑、青）に対して色の間を線形補間する
+        lut[:, i] = np.interp(positions, stops, rgbs[:, i]) # 小数部分はcreate_colormapと同じく切り捨て
+    lut.flags.writeable = False # キャッシュしたテーブルを書き換えられないようにする
+    return lut
+
+class Colorizer: # --- ルックアップテーブルで色付けするクラス（作業用と出力用のバッファを使い回す） ---
+    def __init__(self): # --- Colorizerクラスのコンストラクタの定義 ---
+        self._buffers = {} # (形, 型) → バッファ
+
+    def _buffer(self, shape, dtype): # --- 指定した形と型のバッファを返すメソッド（なければ確保する） ---
+        key = (shape, np.dtype(dtype))
+        if key not in self._buffers:
+            self._buffers[key] = np.empty(shape, dtype=dtype)
+        return self._buffers[key]
+
+    def colorize(self, values, colors_hex, cyclic=False, cycles=1): # --- 0～1の値をルックアップテーブルでRGBに変換するメソッド ---
+        # 戻り値は次の呼び出しで上書きされるので、残しておく場合はコピーする
+        if len(values.shape) != 2: # 入力が2次元配列か確認
+            raise ValueError(f"Expected 2D values array, got shape {values.shape}")
+        lut = build_lut(tuple(colors_hex), LUT_SIZE, cyclic) # ルックアップテーブル（キャッシュ済みならそれを使う）
+        index = self._buffer(values.shape, np.intp) # テーブルの番号
+        colors = self._buffer(values.shape + (3,), np.uint8) # 出力するRGB配列
+        if cyclic: # 周期的なパレットは cycles 周してから番号をテーブルの大きさで割った余りにする
+            np.multiply(values, LUT_SIZE * cycles, out=index, casting='unsafe')
+            np.maximum(index, 0, out=index) # 0以下（最初の反復で脱出した点）は周期に関係なく開始色にする（非周期と同じ）
+            np.bitwise_and(index, LUT_SIZE - 1, out=index) # LUT_SIZEは2のべき乗なので余りはビット演算で求める
+        else: # 0以下は開始色、1は終了色になる（範囲外はnp.takeのclipで端の色になる）
+            np.multiply(values, LUT_SIZE - 1, out=index, casting='unsafe')
+        np.take(lut, index, axis=0, out=colors, mode='clip') # テーブルから色を一度に取り出す
+        return colors
+
+def gradient_colors(start_color_hex, end_color_hex):  # --- 開始色と終了色の組を返す関数（変換できなければ青→白） ---
+    try:  # カラーコードをRGBに変換できるか確認（作ったテーブルはキャッシュされる）
+        build_lut((start_color_hex, end_color_hex))
     except:  # 変換に失敗したらデフォルト値を使用
-        start_rgb = (0, 0, 255)  # 開始色を青に設定
-        end_rgb = (255, 255, 255)  # 終了色を白に設定
-#        bg_rgb = (0, 0, 0)  # 背景色を黒に設定
-    if len(values.shape) != 2:  # 入力が2次元配列か確認
-        raise ValueError(f"Expected 2D values array, got shape {values.shape}")
-#    colors = np.full((values.shape[0], values.shape[1], 3), bg_rgb, dtype=np.uint8)  # 全ピクセルを背景色で埋めたRGB配列を初期化
-    colors = np.full((values.shape[0], values.shape[1], 3), start_rgb, dtype=np.uint8)  # 全ピクセルを背景色で埋めたRGB配列を初期化
-    mask = values > 0  # 正の値を持つピクセルを選択
-    normalized = np.where(mask, values, 0)  # 正の値はそのまま、0以下は0に
-    for i in range(3):  # RGBの各成分（赤、緑、青）に対して
-        colors[mask, i] = start_rgb[i] + normalized[mask] * (end_rgb[i] - start_rgb[i])  # 正の値に開始色から終了色へのグラデーションを適用
-    return colors  # 生成したカラーマップを返す
+        start_color_hex = "#0000FF"  # 開始色を青に設定
+        end_color_hex = "#FFFFFF"  # 終了色を白に設定
+    return start_color_hex, end_color_hex
+
+def create_colormap(values, start_color_hex, end_color_hex, colorizer=None):  # --- 数値データからRGBカラーマップを生成 ---
+#def create_colormap(values, start_color_hex, end_color_hex, bg_color_hex):  # --- 数値データからRGBカラーマップを生成 ---
+    colors_hex = gradient_colors(start_color_hex, end_color_hex)  # 無効なカラーコードはデフォルト値にする
+    if colorizer is None:  # バッファを使い回さない場合は毎回新しく作る
+        colorizer = Colorizer()
+    return colorizer.colorize(values, colors_hex)  # ルックアップテーブルで色付けしたカラーマップを返す
 
 def choose_color(parent, current_color_hex, title): # --- カラーパレットを表示して色を選択する関数 ---
+    from tkinter import colorchooser # GUIでしか使わないのでここで読み込む（ヘッドレス描画でtkinterを読み込まないように）
     color_code = colorchooser.askcolor( # カラーパレットを表示
         color=current_color_hex, # 現在の色を設定
         title=title # タイトルを設定
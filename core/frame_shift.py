@@ -0,0 +1,35 @@
+import numpy as np
+
+SHIFT_TOLERANCE = 1e-3 # 整数ピクセルの移動とみなすずれの上限（ピクセル単位）
+
+def pixel_shift(previous, x, y, c, max_iter, precision='complex128'): # --- 前のフレームから整数ピクセルだけ平行移動したビューかを調べる関数 ---
+    # previous は前のフレームの {'x', 'y', 'c', 'max_iter', 'precision'}。平行移動なら (dx, dy)、そうでなければ None を返す
+    if (previous is None or previous['c'] != c or previous['max_iter'] != max_iter
+            or previous.get('precision', 'complex128') != precision): # パラメータや計算の精度が変わっていたら使えない
+        return None
+    shift = []
+    for old, new in ((previous['x'], x), (previous['y'], y)): # x軸とy軸のそれぞれで調べる
+        if len(old) != len(new) or len(new) < 2: # ピクセル数が変わっていたら使えない
+            return None
+        step = old[1] - old[0] # 1ピクセルあたりの幅
+        if abs((new[1] - new[0]) - step) > abs(step) * SHIFT_TOLERANCE / len(new): # 拡大率が変わっていたら使えない
+            return None
+        offset = (new[0] - old[0]) / step # 移動量（ピクセル単位）
+        pixels = int(round(offset)) # 整数ピクセルに丸める
+        if abs(offset - pixels) > SHIFT_TOLERANCE or abs(pixels) >= len(new): # 整数でないか、画面の外まで移動した場合は使えない
+            return None
+        shift.append(pixels)
+    return tuple(shift)
+
+def _spans(d, n): # --- 移動量dのときの移動先と移動元の範囲を返す関数 ---
+    if d >= 0:
+        return slice(0, n - d), slice(d, n)
+    return slice(-d, n), slice(0, n + d)
+
+def shift_frame(raw, known, dx, dy): # --- 脱出値の配列をその場で平行移動し、移動してきたピクセルを計算済みにする関数 ---
+    # 新しいピクセル (i, j) は前のピクセル (i + dy, j + dx) と同じ点になる
+    dst_y, src_y = _spans(dy, raw.shape[0])
+    dst_x, src_x = _spans(dx, raw.shape[1])
+    raw[dst_y, dst_x] = raw[src_y, src_x] # 重なっていてもNumPyが正しくコピーする
+    known[:] = False # 新しく見えるようになった行と列は未計算
+    known[dst_y, dst_x] = True # 移動してきた部分は計算済み
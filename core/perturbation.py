@@ -0,0 +1,161 @@
+import math
+from decimal import Decimal, localcontext
+import numpy as np
+from core.fractal import RenderCancelled, PERIOD_TOLERANCE, PERIOD_CHECK_INTERVAL, add_live_pixels
+
+# 摂動法による深い拡大の計算
+# 1つの参照点の軌道 Z_n だけを decimal で高精度に計算し、各ピクセルは参照軌道との差 δ_n を float64 で反復する
+# （z_n = Z_n + δ_n、δ_{n+1} = (2 Z_n + δ_n) δ_n。Julia集合では c が全ピクセル共通なので c の差の項はない）
+# δ は float64 の指数の範囲で表せればよいので、ビューの幅がおよそ 1e-290 までの拡大を計算できる
+
+PRECISION_LIMIT = 1e-12 # 1ピクセルの幅が座標の大きさのこれ倍より小さくなったら摂動法で計算する
+GUARD_DIGITS = 20 # 参照軌道とビューの計算で1ピクセルの幅の桁数に加える桁数
+GLITCH_TOLERANCE = 1e-3 # |Z_n + δ_n| < GLITCH_TOLERANCE * |Z_n| になったら差の精度が足りない（グリッチ）とみなす
+MAX_REFERENCES = 16 # 1フレームで使う参照点の数の上限（最後の参照点ではグリッチを判定しない）
+CANCEL_INTERVAL = 1024 # 参照軌道の計算中に取り消しを確認する間隔（反復回数）
+
+def needs_perturbation(view, size): # --- float64の座標では1ピクセルの幅を表せなくなるビューかを返す関数 ---
+    # view は (x_min, x_max, y_min, y_max)（float でも Decimal でもよい）、size は (幅, 高さ)
+    step = min(float(view[1] - view[0]) / (size[0] - 1), float(view[3] - view[2]) / (size[1] - 1)) # 1ピクセルの幅
+    scale = max(1.0, *(abs(float(v)) for v in view)) # 軌道の値は |z|<=2 程度なので、原点の近くでも1を下限にする
+    return step < scale * PRECISION_LIMIT
+
+def precision(view, size): # --- ビューの座標と参照軌道の計算に必要な10進の桁数を返す関数 ---
+    step = min(abs(Decimal(view[1]) - Decimal(view[0])) / (size[0] - 1), abs(Decimal(view[3]) - Decimal(view[2])) / (size[1] - 1))
+    if step == 0:
+        raise ValueError(f"Empty view: {view}")
+    return max(28, GUARD_DIGITS - math.floor(step.log10())) # 28 は decimal の既定の桁数
+
+def reference_orbit(x, y, c, max_iter, digits, cancel=None): # --- 参照点 x + yi の軌道を高精度で計算し、float64に丸めた Z_0..Z_N を返す関数 ---
+    # 参照点が発散したら最初に |Z_N|>2 になった値までを返す（N < max_iter）。発散しなければ max_iter + 1 個の値を返す
+    orbit = np.empty(max_iter + 1, dtype=np.complex128)
+    with localcontext() as ctx:
+        ctx.prec = digits
+        cr, ci = Decimal(c.real), Decimal(c.imag) # c は float の値をそのまま使う（丸めない）
+        zr, zi = +Decimal(x), +Decimal(y) # 単項の + で現在の桁数に丸める
+        for n in range(max_iter + 1):
+            orbit[n] = complex(float(zr), float(zi))
+            rr, ii = zr * zr, zi * zi
+            if rr + ii > 4: # 参照点が発散した
+                return orbit[:n + 1]
+            if n == max_iter:
+                break
+            if cancel is not None and n % CANCEL_INTERVAL == CANCEL_INTERVAL - 1 and cancel():
+                raise RenderCancelled()
+            zr, zi = rr - ii + cr, 2 * zr * zi + ci # z = z² + c
+    return orbit
+
+def delta_values(orbit, delta, max_iter, cancel=None, stats=None, detect_glitches=True): # --- 参照軌道からの差を反復して脱出値を計算する関数 ---
+    # (正規化前の脱出値, グリッチのマスク, グリッチになったときの |z|²/|Z|²) を返す（グリッチのピクセルの値は0のまま）
+    # 参照点が先に発散して反復を続けられなくなったピクセルもグリッチとして返す（新しい参照点で計算し直す）
+    # 周期軌道に入ったピクセルは fractal.escape_values と同じ方法で見つけて打ち切る。ただし深い拡大では反発的な周期点の
+    # ごく近くの軌道も float64 の z では止まって見えるので、保存点から δ が大きくなっていない（縮んでいる）ピクセルだけを打ち切る
+    output = np.zeros(delta.size, dtype=np.float32) # 出力用の配列（脱出値の式は fractal.escape_values と同じ）
+    glitched = np.zeros(delta.size, dtype=bool)
+    score = np.ones(delta.size, dtype=np.float64) # 小さいほど参照点に向いている（グリッチの中心に近い）
+    orbit_r2 = orbit.real * orbit.real + orbit.imag * orbit.imag # |Z_n|²
+    tol2 = GLITCH_TOLERANCE ** 2
+    z = orbit[0] + delta # 各ピクセルの z_0
+    r2 = z.real * z.real + z.imag * z.imag
+    live = np.flatnonzero(r2 <= 4) # 最初から発散しているピクセルは計算しない
+    d = delta[live] # 生きているピクセルの δ（圧縮しながら使う）
+    z = np.empty(live.size, dtype=np.complex128) # z = Z + δ の作業用バッファ
+    t = np.empty(live.size, dtype=np.complex128) # 2Z + δ の作業用バッファ
+    r2 = np.empty(live.size, dtype=np.float64)
+    tmp = np.empty(live.size, dtype=np.float64)
+    d2 = np.empty(live.size, dtype=np.float64) # |z - 保存点|² の作業用バッファ
+    saved = orbit[0] + delta # 周期を調べるための保存点（ピクセルの位置で持つ）
+    saved_d2 = delta.real * delta.real + delta.imag * delta.imag # 保存点での |δ|²
+    moving = delta != 0 # 参照点そのもの以外のピクセル（参照点は軌道が float64 で止まって見えても周期とはみなせない）
+    period_tol2 = PERIOD_TOLERANCE ** 2
+    next_save = 1
+
+    for n in range(max_iter):
+        if live.size == 0:
+            break
+        if cancel is not None and cancel():
+            raise RenderCancelled()
+        if n + 1 >= orbit.size: # 参照点が発散したので、残りのピクセルは別の参照点で計算し直す
+            glitched[live] = True
+            break
+        if stats is not None:
+            stats['pixel_iterations'] = stats.get('pixel_iterations', 0) + live.size
+            add_live_pixels(stats, n, live.size)
+        np.add(d, 2 * orbit[n], out=t)
+        np.multiply(t, d, out=d) # δ = (2Z + δ) δ
+        np.add(d, orbit[n + 1], out=z) # z = Z + δ
+        np.multiply(z.real, z.real, out=r2)
+        np.multiply(z.imag, z.imag, out=tmp)
+        np.add(r2, tmp, out=r2) # |z|²
+        escaped = r2 > 4
+        done = escaped
+        if escaped.any():
+            output[live[escaped]] = n + 1 - np.log2(np.log2(r2[escaped]) * 0.5)
+        if detect_glitches:
+            lost = r2 < tol2 * orbit_r2[n + 1] # z が参照軌道よりずっと0に近づくと δ の桁落ちで値が合わなくなる
+            if lost.any():
+                glitched[live[lost]] = True
+                score[live[lost]] = r2[lost] / orbit_r2[n + 1]
+                done = escaped | lost
+        if (n + 1) % PERIOD_CHECK_INTERVAL == 0:
+            np.take(saved, live, out=t) # t は次の反復で上書きするので作業用に使う
+            np.subtract(z, t, out=t) # z - 保存点
+            np.multiply(t.real, t.real, out=d2)
+            np.multiply(t.imag, t.imag, out=tmp)
+            np.add(d2, tmp, out=d2)
+            settled = d2 < period_tol2
+            if settled.any(): # 参照点そのものと δ が大きくなっているピクセルは周期に入ったとみなさない
+                np.multiply(d.real, d.real, out=d2)
+                np.multiply(d.imag, d.imag, out=tmp)
+                np.add(d2, tmp, out=d2) # |δ|²
+                np.take(saved_d2, live, out=tmp)
+                settled &= (d2 <= tmp) & moving[live]
+            if settled.any(): # 値は0のまま
+                done = done | settled
+        if n + 1 == next_save: # 保存点を更新して間隔を2倍にする
+            saved[live] = z
+            saved_d2[live] = d.real * d.real + d.imag * d.imag
+            next_save *= 2
+        if done.any(): # 生きているピクセルを圧縮する
+            keep = ~done
+            live = live[keep]
+            d = d[keep]
+            z, t, r2, tmp, d2 = z[:live.size], t[:live.size], r2[:live.size], tmp[:live.size], d2[:live.size]
+
+    return output, glitched, score
+
+def perturbation_values(view, width, height, c, max_iter, skip=1, cancel=None, stats=None): # --- 深く拡大したビューの正規化前の脱出値を摂動法で計算する関数 ---
+    # view は Decimal の (x_min, x_max, y_min, y_max)。skip 間隔で間引いた (height/skip, width/skip) の配列を返す
+    # stats に辞書を渡すと 'pixel_iterations'、使った参照点の数 'references'、最後まで直らなかったピクセル数 'glitched_pixels' を足し込む
+    digits = precision(view, (width, height))
+    with localcontext() as ctx:
+        ctx.prec = digits
+        x_min, y_min = Decimal(view[0]), Decimal(view[2])
+        step_x = (Decimal(view[1]) - x_min) / (width - 1) # 1ピクセルの幅（高精度）
+        step_y = (Decimal(view[3]) - y_min) / (height - 1)
+    cols = np.arange(0, width, skip) # 計算する列（画像全体のピクセル番号）
+    rows = np.arange(0, height, skip)
+    output = np.zeros(rows.size * cols.size, dtype=np.float32) # 平坦化した出力
+    pending = np.arange(output.size) # これから計算するピクセル
+    ref_row, ref_col = height // 2, width // 2 # 最初の参照点は画像の中心
+    for k in range(MAX_REFERENCES):
+        with localcontext() as ctx:
+            ctx.prec = digits
+            ref_x, ref_y = x_min + step_x * ref_col, y_min + step_y * ref_row
+        orbit = reference_orbit(ref_x, ref_y, c, max_iter, digits, cancel)
+        # 参照点からの差はピクセル数 × 1ピクセルの幅なので float64 で正確に表せる
+        delta = (cols[pending % cols.size] - ref_col) * float(step_x) + 1j * ((rows[pending // cols.size] - ref_row) * float(step_y))
+        last = k == MAX_REFERENCES - 1 # 最後の参照点ではグリッチを判定せずに値を受け入れる
+        values, glitched, score = delta_values(orbit, delta, max_iter, cancel, stats, not last)
+        output[pending] = values
+        if stats is not None:
+            stats['references'] = stats.get('references', 0) + 1
+        if not glitched.any():
+            break
+        pending = pending[glitched] # グリッチのピクセルだけを計算し直す
+        best = pending[np.argmin(score[glitched])] # グリッチの中心に最も近いピクセルを次の参照点にする
+        ref_row, ref_col = int(rows[best // cols.size]), int(cols[best % cols.size])
+    else:
+        if stats is not None: # 参照点を使い切っても参照点より長く生き残ったピクセル
+            stats['glitched_pixels'] = stats.get('glitched_pixels', 0) + int(np.count_nonzero(glitched))
+    return output.reshape(rows.size, cols.size)
@@ -0,0 +1,28 @@
+import numpy as np
+from core import frame_shift
+
+STRIDES = (8, 4, 2, 1) # 段階描画のピクセル間隔（前の間隔で割り切れること）
+
+def render_passes(renderer, x, y, c, max_iter, strides=STRIDES, cancel=None, cache=None, tile_key=None, solver='active', stats=None, precision='complex128'): # --- 粗い格子から順に計算し、各段階の結果を返すジェネレータ ---
+    # cache は TileCache、tile_key は (タイルのキーの前半, 左端の格子番号, 上端の格子番号)（格子上にないビューならNone）
+    # solver は最後の段階（stride=1）の計算方式（fractal.SOLVERS のどれか）
+    # stats に辞書を渡すと全段階の計算量を足し込む（TileRenderer.fill と同じ）。precision は fractal.PRECISIONS のどれか
+    previous = renderer.last_frame # 共有メモリに残っている前のフレームのビュー（途中で取り消された場合はNone）
+    raw, known = renderer.frame((len(y), len(x))) # 脱出値と計算済みマスク（TileRendererの共有メモリ上）
+    shift = frame_shift.pixel_shift(previous, x, y, c, max_iter, precision) # 前のフレームからの平行移動量
+    if shift is not None: # 整数ピクセルの平行移動（パン）なら前の脱出値をずらして使い、新しく見える行と列だけを計算する
+        frame_shift.shift_frame(raw, known, *shift)
+    else:
+        known[:] = False # すべて未計算にする
+    if cache is not None and tile_key is not None: # キャッシュにあるタイルは計算しない
+        cache.load_frame(raw, known, *tile_key)
+    if np.count_nonzero(~known) * strides[0] ** 2 < known.size: # 残りが少なければ段階を踏まずに一度で計算する
+        strides = strides[-1:]
+    for stride in strides: # 間隔を狭めながら計算する
+        # 前の段階で計算済みのピクセルは計算しない（stride=4 の格子は簡易描画の skip=4 と同じ点）
+        renderer.fill(raw, known, x, y, c, max_iter, stride, cancel, solver, stats, precision)
+        if stride == strides[-1]: # 最後まで計算できたらこのフレームのビューを記録する（次のパンで使う）
+            renderer.last_frame = {'x': x, 'y': y, 'c': c, 'max_iter': max_iter, 'precision': precision}
+            if cache is not None and tile_key is not None: # 完成したタイルをキャッシュに保存する
+                cache.store_frame(raw, *tile_key)
+        yield stride, raw[::stride, ::stride] # この段階の格子上の脱出値（次の段階で書き換わるので使う側でコピーする）
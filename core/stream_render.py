@@ -0,0 +1,105 @@
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from core import fractal, color_map
+from core.tile_renderer import process_workspace
+
+# 1ピクセルあたりのおおよその作業メモリ（複素数グリッドと未計算のピクセルのコピー 32, 出力 4,
+# escape_values の作業用バッファ 89（complex64 なら 57）, 詰め替えのインデックス 8, マスクなど）
+BYTES_PER_PIXEL = 136
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n' # PNGファイルの先頭
+
+def band_rows(width, max_memory): # --- 作業メモリが max_memory バイトに収まる1バンドの行数を返す関数 ---
+    return max(1, int(max_memory // (width * BYTES_PER_PIXEL)))
+
+def fits_in_memory(width, height, max_memory): # --- 画像全体を一度に計算しても max_memory バイトに収まるかを返す関数 ---
+    return width * height * BYTES_PER_PIXEL <= max_memory
+
+def create_raw_file(path, width, height): # --- 脱出値を保存する .npy ファイルを作り、データの開始位置を返す関数 ---
+    raw = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(height, width)) # ヘッダーを書き、残りは疎なファイルになる
+    offset = raw.offset # ヘッダーの大きさ
+    del raw # マップを閉じる（バンドごとに必要な部分だけマップし直す）
+    return offset
+
+def map_band(path, offset, width, row0, row1, mode): # --- .npy ファイルの指定した行だけをメモリマップする関数 ---
+    return np.memmap(path, dtype=np.float32, mode=mode, offset=offset + row0 * width * 4, shape=(row1 - row0, width))
+
+def compute_band(path, offset, x, y_band, row0, c, max_iter, solver='active', precision='complex128'): # --- 1つのバンドの脱出値を計算してファイルに書き込み、正の値の最小値と最大値を返す関数 ---
+    values = np.zeros((len(y_band), len(x)), dtype=np.float32) # 正規化前の脱出値
+    known = np.zeros(values.shape, dtype=bool)
+    fractal.fill_escape_values(values, known, x, y_band, c, max_iter, solver=solver,
+                               precision=precision, workspace=process_workspace()) # バンドの大きさは同じなので作業用のバッファを使い回す
+    band = map_band(path, offset, len(x), row0, row0 + len(y_band), 'r+')
+    band[:] = values # ファイルに書き込む
+    band.flush()
+    del band # マップを閉じてメモリを返す
+    positive = values[values > 0]
+    if positive.size == 0: # 発散したピクセルがないバンド
+        return None
+    return float(positive.min()), float(positive.max())
+
+def compute_raw(path, view, width, height, c, max_iter, max_memory, workers=1, solver='active', precision='complex128'): # --- 1パス目: バンドごとに脱出値をファイルに書き込み、全体の最小値と最大値を集める関数 ---
+    offset = create_raw_file(path, width, height)
+    x = np.linspace(view[0], view[1], width) # x軸の値（全バンド共通）
+    y = np.linspace(view[2], view[3], height) # y軸の値
+    rows = band_rows(width, max_memory / workers) # 各プロセスが上限を分け合う
+    bands = [(row0, y[row0:row0 + rows]) for row0 in range(0, height, rows)]
+    if workers <= 1: # 同じプロセスで順に計算する
+        stats = [compute_band(path, offset, x, y_band, row0, c, max_iter, solver, precision) for row0, y_band in bands]
+    else: # 各ワーカーが自分のバンドをファイルに直接書き込む（結果の配列はpickleしない）
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(compute_band, path, offset, x, y_band, row0, c, max_iter, solver, precision) for row0, y_band in bands]
+            stats = [future.result() for future in futures]
+    stats = [s for s in stats if s is not None]
+    if not stats: # 発散したピクセルが1つもない
+        return offset, None
+    return offset, (min(s[0] for s in stats), max(s[1] for s in stats))
+
+def png_chunk(kind, data): # --- PNGのチャンクを作る関数 ---
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def write_png(path, raw_path, offset, width, height, bounds, colors_hex, max_memory, cyclic=False, cycles=1): # --- 2パス目: バンドごとに正規化と色付けをしてPNGに書き出す関数 ---
+    rows = band_rows(width, max_memory)
+    colorizer = color_map.Colorizer()
+    compressor = zlib.compressobj(6)
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))) # 8ビットRGB、インターレースなし
+        for row0 in range(0, height, rows):
+            row1 = min(row0 + rows, height)
+            band = map_band(raw_path, offset, width, row0, row1, 'r')
+            values = np.array(band) # 書き換えるのでコピーする
+            del band
+            if bounds is not None: # 画像全体の最小値と最大値で正規化する（バンドの継ぎ目が出ないように）
+                fractal.normalize(values, bounds)
+            rgb = colorizer.colorize(values, colors_hex, cyclic, cycles)
+            scanlines = np.empty((row1 - row0, 1 + width * 3), dtype=np.uint8) # 各行の先頭はフィルタの種類（0 = なし）
+            scanlines[:, 0] = 0
+            scanlines[:, 1:] = rgb.reshape(row1 - row0, width * 3)
+            data = compressor.compress(scanlines.tobytes())
+            if data: # 圧縮済みのデータがたまったらIDATチャンクとして書き出す
+                f.write(png_chunk(b'IDAT', data))
+        f.write(png_chunk(b'IDAT', compressor.flush()))
+        f.write(png_chunk(b'IEND', b''))
+
+def render_png(job, max_memory, workers=1, raw_path=None): # --- ジョブを帯ごとに描画してPNGに書き出す関数（ピーク時のメモリを max_memory バイト程度に抑える） ---
+    if os.path.splitext(job['output'])[1].lower() != '.png':
+        raise ValueError(f"Streaming render writes PNG only, got {job['output']}")
+    keep_raw = raw_path is not None # 脱出値のファイルを残すかどうか
+    raw_path = raw_path or job['output'] + '.raw.npy'
+    os.makedirs(os.path.dirname(os.path.abspath(job['output'])), exist_ok=True)
+    tmp_path = job['output'] + '.part' # 書き終わってから名前を変える
+    try:
+        offset, bounds = compute_raw(raw_path, job['view'], job['width'], job['height'],
+                                     complex(job['real'], job['imag']), job['max_iter'], max_memory, workers, job['solver'],
+                                     fractal.select_precision(job['precision'], job['view'], (job['width'], job['height'])))
+        write_png(tmp_path, raw_path, offset, job['width'], job['height'], bounds,
+                  job['colors'], max_memory, job['cyclic'], job['cycles'])
+        os.replace(tmp_path, job['output'])
+    finally:
+        if not keep_raw and os.path.exists(raw_path):
+            os.remove(raw_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,131 @@
+import hashlib
+import math
+import os
+from collections import OrderedDict
+import numpy as np
+
+LATTICE_TOLERANCE = 1e-3 # 格子上にあるとみなすずれの上限（ピクセル単位）
+
+def snap_view(view, base_view, size, zoom): # --- ビューを拡大段階ごとの格子に揃える関数（ずれは半ピクセル未満） ---
+    # view, base_view は (x_min, x_max, y_min, y_max)、size は (幅, 高さ)、zoom はホイール1段の倍率
+    base_width = base_view[1] - base_view[0] # 初期ビューの幅
+    level = round(math.log((view[1] - view[0]) / base_width) / math.log(zoom)) # 拡大段階
+    snapped = []
+    for axis, pixels in ((0, size[0]), (2, size[1])): # x軸とy軸のそれぞれで揃える
+        origin = base_view[axis] # 格子の原点（初期ビューの最小値）
+        step = (base_view[axis + 1] - origin) * zoom ** level / (pixels - 1) # この拡大段階の1ピクセルの幅
+        low = origin + round((view[axis] - origin) / step) * step # 最小値を格子の点に揃える
+        snapped += [low, low + step * (pixels - 1)] # 最大値は拡大段階から計算し直す（誤差をためない）
+    return tuple(snapped)
+
+def lattice_position(view, base_view, size, zoom): # --- ビューが格子上にあれば (拡大段階, 左端の格子番号, 上端の格子番号) を返す関数 ---
+    base_width = base_view[1] - base_view[0]
+    level = round(math.log((view[1] - view[0]) / base_width) / math.log(zoom)) # 拡大段階
+    position = [level]
+    for axis, pixels in ((0, size[0]), (2, size[1])):
+        origin = base_view[axis]
+        step = (base_view[axis + 1] - origin) * zoom ** level / (pixels - 1)
+        if abs((view[axis + 1] - view[axis]) - step * (pixels - 1)) > step * LATTICE_TOLERANCE: # 拡大段階の幅でなければ格子上にない
+            return None
+        offset = (view[axis] - origin) / step # 原点からのピクセル数
+        if abs(offset - round(offset)) > LATTICE_TOLERANCE: # 整数ピクセルでなければ格子上にない
+            return None
+        position.append(round(offset))
+    return tuple(position)
+
+class TileCache: # --- 正規化前の脱出値をタイル単位でLRU方式に保存するキャッシュ ---
+    def __init__(self, tile_size=128, max_bytes=256 * 2**20, spill_dir=None, max_spill_bytes=1024 * 2**20): # --- TileCacheクラスのコンストラクタの定義 ---
+        self.tile_size = tile_size # タイルの一辺のピクセル数
+        self.max_bytes = max_bytes # メモリ上に置くタイルの合計バイト数の上限
+        self.spill_dir = spill_dir # 追い出したタイルを .npy で保存するディレクトリ（Noneなら捨てる）
+        self.max_spill_bytes = max_spill_bytes # ディスク上のタイルの合計バイト数の上限（超えたら古いファイルから消す）
+        self._tiles = OrderedDict() # キー → タイル（最後に使ったものが末尾）
+        self._bytes = 0 # メモリ上のタイルの合計バイト数
+        self._spilled = OrderedDict() # ディスク上のタイルのパス → ファイルの大きさ（最後に書いたものが末尾）
+        self._spill_bytes = 0 # ディスク上のタイルの合計バイト数
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            entries = [entry for entry in os.scandir(spill_dir) if entry.name.endswith('.npy') and entry.is_file()]
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime): # 前回までに追い出したタイルも上限に数える（古い順）
+                self._spilled[entry.path] = entry.stat().st_size
+                self._spill_bytes += entry.stat().st_size
+            self._trim_spill()
+
+    def _spill_path(self, key): # --- タイルを保存するファイルのパスを返すメソッド ---
+        name = hashlib.sha1(repr(key).encode()).hexdigest() # キーからファイル名を作る（同じキーなら次回起動時も同じ名前）
+        return os.path.join(self.spill_dir, name + '.npy')
+
+    def _unspill(self, path): # --- ディスク上のタイルのファイルを消すメソッド ---
+        self._spill_bytes -= self._spilled.pop(path, 0)
+        try:
+            os.remove(path)
+        except FileNotFoundError: # 別の方法で消されていた場合
+            pass
+
+    def _trim_spill(self): # --- ディスク上のタイルが上限を超えていれば古いものから消すメソッド ---
+        while self._spill_bytes > self.max_spill_bytes and self._spilled:
+            self._unspill(next(iter(self._spilled)))
+
+    def get(self, key): # --- タイルを取り出すメソッド（なければNone） ---
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key) # 最後に使ったタイルにする
+            return tile
+        if self.spill_dir is not None: # ディスクに追い出されていれば読み込んでメモリに戻す
+            path = self._spill_path(key)
+            if path in self._spilled:
+                try:
+                    tile = np.load(path)
+                except (OSError, ValueError): # 壊れたファイルや消されたファイルは計算し直す
+                    self._unspill(path)
+                    return None
+                self.put(key, tile) # 次からはメモリから返す（ディスク上のファイルは put が消す）
+                return tile
+        return None
+
+    def put(self, key, tile): # --- タイルを保存するメソッド ---
+        if key in self._tiles: # 同じキーがあれば入れ替える
+            self._bytes -= self._tiles.pop(key).nbytes
+        if self.spill_dir is not None and self._spilled: # メモリ上のタイルを正とし、ディスク上の古いファイルは消す
+            path = self._spill_path(key)
+            if path in self._spilled:
+                self._unspill(path)
+        self._tiles[key] = tile
+        self._bytes += tile.nbytes
+        while self._bytes > self.max_bytes and self._tiles: # 上限を超えたら古いタイルから追い出す
+            old_key, old_tile = self._tiles.popitem(last=False)
+            self._bytes -= old_tile.nbytes
+            if self.spill_dir is not None: # ディスクに追い出す
+                path = self._spill_path(old_key)
+                np.save(path, old_tile)
+                self._spilled[path] = os.path.getsize(path)
+                self._spill_bytes += self._spilled[path]
+        self._trim_spill()
+
+    def load_frame(self, raw, known, prefix, kx, ky): # --- キャッシュにあるタイルを未計算のピクセルに書き込むメソッド ---
+        # prefix はタイルのキーの前半（c, 反復回数, 格子, 拡大段階）、(kx, ky) はフレーム左上の格子番号
+        height, width = raw.shape
+        size = self.tile_size
+        for ty in range(ky // size, (ky + height - 1) // size + 1): # フレームに重なるタイルの行
+            for tx in range(kx // size, (kx + width - 1) // size + 1): # フレームに重なるタイルの列
+                tile = self.get(prefix + (tx, ty))
+                if tile is None: # キャッシュにないタイルは後で計算する
+                    continue
+                y0, x0 = max(ty * size, ky), max(tx * size, kx) # 重なっている範囲（格子番号）
+                y1, x1 = min((ty + 1) * size, ky + height), min((tx + 1) * size, kx + width)
+                frame = (slice(y0 - ky, y1 - ky), slice(x0 - kx, x1 - kx)) # フレーム内の範囲
+                part = tile[y0 - ty * size:y1 - ty * size, x0 - tx * size:x1 - tx * size] # タイル内の範囲
+                np.copyto(raw[frame], part, where=~known[frame]) # 計算済みのピクセルは書き換えない
+                known[frame] = True
+
+    def store_frame(self, raw, prefix, kx, ky): # --- フレームに完全に含まれるタイルをキャッシュに保存するメソッド ---
+        height, width = raw.shape
+        size = self.tile_size
+        for ty in range(-(-ky // size), (ky + height) // size): # フレームに完全に含まれるタイルの行
+            for tx in range(-(-kx // size), (kx + width) // size):
+                key = prefix + (tx, ty)
+                if key in self._tiles: # すでにあれば使った順番だけ更新する
+                    self._tiles.move_to_end(key)
+                    continue
+                y0, x0 = ty * size - ky, tx * size - kx # フレーム内の左上
+                self.put(key, raw[y0:y0 + size, x0:x0 + size].copy())
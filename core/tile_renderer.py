@@ -0,0 +1,115 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+import numpy as np
+from core import fractal
+
+def frame_arrays(buf, shape): # --- バッファを脱出値の配列と計算済みマスクに分けて配列として扱う関数 ---
+    size = int(np.prod(shape)) # ピクセル数
+    raw = np.ndarray(shape, dtype=np.float32, buffer=buf) # 正規化前の脱出値（先頭から）
+    known = np.ndarray(shape, dtype=np.bool_, buffer=buf, offset=size * 4) # 計算済みのピクセル（脱出値の後ろ）
+    return raw, known
+
+_workspace = None # ワーカープロセスごとの escape_values の作業用バッファ（プロセスプールと同じだけ生き続ける）
+
+def process_workspace(): # --- このプロセスの Workspace を返す関数（ワーカープロセスは1度に1つのバンドしか計算しない） ---
+    global _workspace
+    if _workspace is None:
+        _workspace = fractal.Workspace()
+    return _workspace
+
+def render_band(shm_name, shape, x, y, row0, row1, stride, c, max_iter, solver='active', cols=None, live=False, precision='complex128'): # --- ワーカープロセスで1つの行バンド（colsを指定すればタイル）を計算して共有メモリに書き込む関数 ---
+    shm = shared_memory.SharedMemory(name=shm_name) # 親プロセスが確保した共有メモリに接続する
+    stats = {'live_pixels': []} if live else {} # 計算量（小さな辞書だけを返す。live なら反復ごとの生きているピクセル数も数える）
+    try:
+        raw, known = frame_arrays(shm.buf, shape) # 共有メモリを配列として扱う（コピーしない）
+        fractal.fill_escape_values(raw, known, x, y, c, max_iter, stride, (row0, row1), solver=solver, stats=stats, cols=cols,
+                                   precision=precision, workspace=process_workspace()) # 未計算のピクセルだけを計算して書き込む
+        del raw, known # 共有メモリを閉じる前に配列の参照を外す
+    finally:
+        shm.close() # 接続を閉じる（解放は親プロセスが行う）
+    return stats # 結果の配列は返さない（pickleしない）
+
+class TileRenderer: # --- ビューを行バンドに分割してプロセスプールで並列計算するクラス ---
+    # プロセスプールはMainWindowの描画スレッドとアトラスの描画スレッドから使われるので、生成と解放はロックの中で行う
+    # 共有メモリ（frame, fill, render_raw）はMainWindowの描画スレッドだけが使う
+    parallel_min_pixels = 65536 # これより計算するピクセルが少ない場合はプロセスプールを使わない（起動の待ち時間の方が長いため）
+    region_size = 256 # Mariani–Silver法で1つのワーカーに渡す正方形のタイルの一辺（細いバンドでは長方形を分けられないため）
+
+    def __init__(self, workers=None, tile_rows=32): # --- TileRendererクラスのコンストラクタの定義 ---
+        self.workers = workers or os.cpu_count() or 1 # ワーカー数（未指定ならCPUコア数）
+        self.tile_rows = tile_rows # 1つのバンドの行数
+        self._executor = None # プロセスプール（最初の描画時に生成する）
+        self._lock = threading.Lock() # プロセスプールの生成と解放を守るロック
+        self._closed = False # close() の後はプロセスプールを作り直さない
+        self._shm = None # 出力用の共有メモリ（フレームをまたいで使い回す）
+        self.last_frame = None # 共有メモリに最後まで計算されているフレームのビュー（パンで再利用する）
+        self.workspace = fractal.Workspace() # 同じプロセスで計算するときの作業用バッファ（描画スレッドだけで使う）
+
+    def _get_executor(self): # --- プロセスプールを取得する（なければ生成する）メソッド ---
+        with self._lock: # 2つのスレッドが同時に最初の描画をしてもプールは1つだけ作る
+            if self._closed:
+                raise RuntimeError("TileRenderer is closed")
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def frame(self, shape): # --- 指定した形の脱出値の配列と計算済みマスクを共有メモリ上に確保するメソッド ---
+        self.last_frame = None # 共有メモリを書き換えるので前のフレームは使えなくなる
+        nbytes = int(np.prod(shape)) * 5 # 必要なバイト数（float32の脱出値 + boolのマスク）
+        if self._shm is None or self._shm.size < nbytes: # 足りない場合だけ確保し直す
+            self._release_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return frame_arrays(self._shm.buf, shape)
+
+    def _release_shm(self): # --- 共有メモリを解放するメソッド ---
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def submit(self, func, *args): # --- プロセスプールで関数を実行し、Futureを返すメソッド（アトラスなど共有メモリを使わない計算用。close() の後は RuntimeError） ---
+        return self._get_executor().submit(func, *args)
+
+    def fill(self, raw, known, x, y, c, max_iter, stride=1, cancel=None, solver='active', stats=None, precision='complex128'): # --- stride間隔の格子のうち未計算のピクセルを並列計算するメソッド ---
+        # raw, known は frame() で確保した共有メモリ上の配列であること
+        pixels = np.count_nonzero(~known[::stride, ::stride]) # 今回計算するピクセル数
+        if self.workers <= 1 or pixels < self.parallel_min_pixels: # ワーカーが1つか計算量が少なければ同じプロセスで計算する
+            fractal.fill_escape_values(raw, known, x, y, c, max_iter, stride, cancel=cancel, solver=solver, stats=stats,
+                                       precision=precision, workspace=self.workspace)
+            return
+        if solver == 'mariani_silver' and stride == 1: # 正方形のタイルに分ける
+            regions = [((row0, row0 + self.region_size), (col0, col0 + self.region_size))
+                       for row0 in range(0, raw.shape[0], self.region_size) for col0 in range(0, raw.shape[1], self.region_size)]
+        else: # 行バンドに分ける
+            regions = [((row0, row0 + self.tile_rows), None) for row0 in range(0, raw.shape[0], self.tile_rows)]
+        executor = self._get_executor()
+        live = stats is not None and 'live_pixels' in stats # 呼び出し側が反復ごとの生きているピクセル数を求めているか
+        futures = [ # バンド（タイル）ごとにワーカーへ投げる
+            executor.submit(render_band, self._shm.name, raw.shape, x, y, rows[0], rows[1], stride, c, max_iter, solver, cols, live, precision)
+            for rows, cols in regions
+        ]
+        for future in as_completed(futures): # バンドの完了を順に待つ（ワーカーの例外はここで再送出される）
+            band_stats = future.result()
+            if stats is not None: # バンドごとの計算量を合計する
+                fractal.merge_stats(stats, band_stats)
+            if cancel is not None and cancel(): # 新しい描画要求が来ていたら残りのバンドを取り消す
+                for pending in futures:
+                    pending.cancel() # まだ始まっていないバンドを取り消す
+                wait(futures) # 実行中のバンドが共有メモリに書き終わるのを待つ（次のフレームと混ざらないように）
+                raise fractal.RenderCancelled()
+
+    def render_raw(self, x, y, c, max_iter, cancel=None, solver='active', stats=None, precision='complex128'): # --- x軸とy軸の値から正規化前の脱出値を並列計算するメソッド ---
+        raw, known = self.frame((len(y), len(x))) # 共有メモリ上の出力配列
+        known[:] = False # すべて未計算にする
+        self.fill(raw, known, x, y, c, max_iter, 1, cancel, solver, stats, precision) # 全ピクセルを計算する
+        return raw.copy() # 共有メモリは次のフレームで使い回すのでコピーを返す
+
+    def close(self): # --- プロセスプールと共有メモリを解放するメソッド（プールを使うスレッドを止めてから呼ぶこと） ---
+        with self._lock:
+            self._closed = True # これ以降の submit や並列計算は RuntimeError にする
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        self._release_shm()
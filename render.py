@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+from core import animation, antialias, batch, fractal, stream_render
+
+def parse_size(text): # --- "幅x高さ" の形式の文字列を解析する関数 ---
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return width, height
+
+def build_parser(): # --- コマンドライン引数の解析器を作る関数 ---
+    parser = argparse.ArgumentParser(description="Julia集合をウィンドウを開かずに描画する")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    image = commands.add_parser('image', help="1枚の画像を描画する")
+    image.add_argument('output', help="出力する画像ファイル（拡張子で形式を決める）")
+    image.add_argument('--size', type=parse_size, default=(batch.DEFAULT_JOB['width'], batch.DEFAULT_JOB['height']), help="画像の大きさ（例: 3840x2160）")
+    image.add_argument('--view', type=float, nargs=4, metavar=('X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX'), default=batch.DEFAULT_JOB['view'], help="表示範囲")
+    image.add_argument('--real', type=float, default=batch.DEFAULT_JOB['real'], help="cの実部")
+    image.add_argument('--imag', type=float, default=batch.DEFAULT_JOB['imag'], help="cの虚部")
+    image.add_argument('--max-iter', type=int, default=batch.DEFAULT_JOB['max_iter'], help="最大反復回数")
+    image.add_argument('--colors', nargs='+', default=batch.DEFAULT_JOB['colors'], help="グラデーションの色（2色以上の #RRGGBB）")
+    image.add_argument('--cyclic', action='store_true', help="周期的なパレットにする")
+    image.add_argument('--cycles', type=int, default=1, help="周期的なパレットの周回数")
+    image.add_argument('--solver', choices=fractal.SOLVERS, default=batch.DEFAULT_JOB['solver'], help="計算方式")
+    image.add_argument('--precision', choices=fractal.PRECISIONS, default=batch.DEFAULT_JOB['precision'], help="計算の精度（complex64 は作業メモリが小さく速い。深く拡大したビューは complex128 で計算する）")
+    image.add_argument('--antialias', type=float, default=batch.DEFAULT_JOB['antialias'], metavar='SHARE', help=f"境界のピクセルだけをアンチエイリアスする。追加サンプル数の上限をピクセル数に対する割合で指定する（例: {antialias.DEFAULT_BUDGET}。帯ごとの描画では使わない）")
+    image.add_argument('--stats', action='store_true', help="計算したピクセル×反復回数などを表示する")
+    image.add_argument('--workers', type=int, default=None, help="並列計算するプロセス数（既定はCPUコア数）")
+    image.add_argument('--max-memory', type=int, default=batch.DEFAULT_MAX_MEMORY // 2**20, help="作業メモリの上限（MB）。超える画像は帯ごとに描画してPNGに書き出す")
+    image.add_argument('--stream', action='store_true', help="大きさに関係なく帯ごとに描画する（PNGのみ）")
+    image.add_argument('--raw', default=None, help="帯ごとに描画するときの脱出値を残す .npy ファイル（既定は描画後に削除する）")
+
+    jobs = commands.add_parser('batch', help="ジョブファイルに書かれた画像をまとめて描画する")
+    jobs.add_argument('jobs', help="ジョブファイル（JSONのリスト。各要素は output と image と同じ名前のパラメータを持つ）")
+    jobs.add_argument('--workers', type=int, default=None, help="同時に描画するジョブ数（既定はCPUコア数）")
+    jobs.add_argument('--force', action='store_true', help="出力が既にあっても描画し直す")
+    jobs.add_argument('--max-memory', type=int, default=batch.DEFAULT_MAX_MEMORY // 2**20, help="全ジョブ合計の作業メモリの上限（MB）")
+
+    anim = commands.add_parser('animate', help="キーフレームを補間したアニメーションを描画する")
+    anim.add_argument('spec', help="アニメーションのファイル（JSON。width, height, colors などと keyframes のリスト）")
+    anim.add_argument('output', nargs='?', default=None, help=f"出力先。.png なら連番のPNG（例: {animation.PATTERN_EXAMPLE.replace('%', '%%')}）、'-' なら標準出力、それ以外はファイルに rgb24 の生の映像を書き出す")
+    anim.add_argument('--pipe', default=None, metavar='COMMAND', help="rgb24 の生の映像を標準入力に流すコマンド（例: \"ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - out.mp4\"）")
+    anim.add_argument('--workers', type=int, default=None, help="並列計算するプロセス数（既定はCPUコア数）")
+    anim.add_argument('--ahead', type=int, default=animation.DEFAULT_AHEAD, help="先に計算してよいフレームのまとまりの数")
+    anim.add_argument('--stats', action='store_true', help="計算量と再利用したフレーム数を表示する")
+    return parser
+
+def main(argv=None): # --- コマンドラインから実行されたときの処理 ---
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == 'image': # 1枚の画像を描画する
+            from core.tile_renderer import TileRenderer
+            job = batch.make_job(
+                output=args.output, view=args.view, width=args.size[0], height=args.size[1],
+                real=args.real, imag=args.imag, max_iter=args.max_iter,
+                colors=args.colors, cyclic=args.cyclic, cycles=args.cycles, solver=args.solver, precision=args.precision, antialias=args.antialias)
+            max_memory = args.max_memory * 2**20
+            if args.stream or not stream_render.fits_in_memory(job['width'], job['height'], max_memory): # 大きな画像は帯ごとに描画する
+                stream_render.render_png(job, max_memory, args.workers or os.cpu_count() or 1, args.raw)
+            else:
+                renderer = TileRenderer(args.workers) # 1枚の画像は行バンドに分けて並列計算する
+                stats = {} # 計算量
+                try:
+                    batch.save_image(batch.render_image(job, renderer, stats), job['output'])
+                finally:
+                    renderer.close()
+                if args.stats:
+                    for key, value in sorted(stats.items()):
+                        print(f"{key}\t{value}")
+            print(job['output'])
+        elif args.command == 'animate': # キーフレームからアニメーションを描画する
+            if (args.output is None) == (args.pipe is None):
+                raise ValueError("Give either an output or --pipe")
+            job, keyframes = animation.load_animation(args.spec)
+            stats = {}
+            frames = animation.render_animation(job, keyframes, args.output, args.pipe, args.workers, max(1, args.ahead), stats)
+            log = sys.stderr if args.output == '-' else sys.stdout # 標準出力に映像を書き出しているときはメッセージを混ぜない
+            if args.stats:
+                for key, value in sorted(stats.items()):
+                    print(f"{key}\t{value}", file=log)
+            print(f"{frames} frames", file=log)
+        else: # ジョブファイルの画像をまとめて描画する（1ジョブ1プロセス）
+            for output, status in batch.run_jobs(batch.load_jobs(args.jobs), args.workers, args.force, args.max_memory * 2**20):
+                print(f"{status}\t{output}")
+    except (OSError, ValueError) as e: # 入力の誤りはメッセージだけを表示する
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__": # もし、このファイルが直接実行されたときは、次を実行する
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import tkinter as tk
+from tkinter import ttk
+from PIL import Image, ImageTk
+from .render_worker import RenderWorker
+from core import atlas
+
+class AtlasWindow(tk.Toplevel): # --- パラメータ平面のアトラス（c ごとのサムネイルの一覧）を表示するウィンドウ ---
+    # サムネイルをクリックするとその c をMainWindowに読み込み、ホイールでポインタの位置を中心に c の範囲を拡大・縮小する
+    zoom_step = 0.5 # ホイール1段あたりの c の範囲の倍率
+
+    def __init__(self, main_window, grid=(16, 16), thumb=48): # --- AtlasWindowクラスのコンストラクタの定義（画面に収まるように既定の格子はAPIより小さい） ---
+        super().__init__(main_window.root)
+        self.title("パラメータ平面のアトラス")
+        self.main_window = main_window
+        self.grid_size = grid # (列数, 行数)
+        self.thumb = thumb # サムネイルの一辺（ピクセル）
+        self.plane = atlas.DEFAULT_PLANE # 表示している c の範囲
+        self.cs = atlas.atlas_params(self.plane, grid) # 各サムネイルの c（描画要求を出すたびに更新する）
+        width = grid[0] * (thumb + atlas.GAP) - atlas.GAP
+        height = grid[1] * (thumb + atlas.GAP) - atlas.GAP
+        self.canvas = tk.Canvas(self, width=width, height=height, bg='white', highlightthickness=0)
+        self.canvas.pack()
+        self.photo = ImageTk.PhotoImage('RGB', (width, height)) # 描画のたびに画素を書き換える（MainWindowと同じ）
+        self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        self.marker = self.canvas.create_rectangle(0, 0, 0, 0, outline='red', width=2, state=tk.HIDDEN) # 最後に選んだサムネイルの枠
+        self.status = ttk.Label(self, text="") # ポインタの下のサムネイルの c
+        self.status.pack(fill=tk.X)
+        self.canvas.bind('<Button-1>', self.on_click) # クリックでその c をMainWindowに読み込む
+        self.canvas.bind('<Motion>', self.on_motion)
+        self.canvas.bind('<MouseWheel>', self.on_mousewheel)
+        self.canvas.bind('<Button-4>', self.on_mousewheel) # Linux用
+        self.canvas.bind('<Button-5>', self.on_mousewheel)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        # 計算はMainWindowと同じくバックグラウンドのスレッドで行い、MainWindowのプロセスプールを使う
+        self.render_worker = RenderWorker(self._render_atlas)
+        self.render_worker.start()
+        self.poll_id = self.after(self.main_window.poll_interval, self._poll_frame) # 閉じるときに取り消す
+        self.draw()
+
+    def draw(self): # --- 現在の c の範囲と色でアトラスの描画要求を出す ---
+        self.cs = atlas.atlas_params(self.plane, self.grid_size)
+        self.canvas.itemconfigure(self.marker, state=tk.HIDDEN) # 範囲が変わるので枠を消す
+        self.render_worker.submit({
+            'cs': self.cs,
+            'colors': (self.main_window.start_color.get(), self.main_window.end_color.get())
+        })
+
+    def _render_atlas(self, job, cancel): # --- アトラスの画像を計算する（RenderWorkerのスレッドで実行されるジェネレータ） ---
+        values = atlas.render_atlas(job['cs'], thumb=self.thumb, renderer=self.main_window.tile_renderer, cancel=cancel)
+        yield Image.fromarray(atlas.atlas_image(values, self.grid_size, job['colors']))
+
+    def _poll_frame(self): # --- 完成したアトラスを受け取って表示する（Tkスレッドで実行） ---
+        img = self.render_worker.take_result()
+        if img is not None:
+            self.photo.paste(img)
+        self.poll_id = self.after(self.main_window.poll_interval, self._poll_frame)
+
+    def _cell(self, event): # --- イベントの位置のサムネイルの (行, 列) を返す（隙間ならNone） ---
+        return atlas.cell_at(event.x, event.y, self.grid_size, self.thumb)
+
+    def on_click(self, event): # --- クリックしたサムネイルの c をMainWindowに読み込む ---
+        cell = self._cell(event)
+        if cell is None:
+            return
+        c = self.cs[cell]
+        self.main_window.real.set(float(c.real))
+        self.main_window.imag.set(float(c.imag))
+        self.main_window.quick_draw()
+        x0, y0 = cell[1] * (self.thumb + atlas.GAP), cell[0] * (self.thumb + atlas.GAP)
+        self.canvas.coords(self.marker, x0, y0, x0 + self.thumb, y0 + self.thumb)
+        self.canvas.itemconfigure(self.marker, state=tk.NORMAL)
+
+    def on_motion(self, event): # --- ポインタの下のサムネイルの c を表示する ---
+        cell = self._cell(event)
+        if cell is None:
+            self.status.configure(text="")
+            return
+        c = self.cs[cell]
+        self.status.configure(text=f"c = {c.real:.6f} {c.imag:+.6f}i")
+
+    def on_mousewheel(self, event): # --- ポインタの下の c を中心に c の範囲を拡大・縮小して描き直す ---
+        cell = self._cell(event)
+        if cell is None:
+            return
+        c = self.cs[cell]
+        if event.num == 4 or event.delta > 0: # ホイール上回転で拡大
+            factor = self.zoom_step
+        else:
+            factor = 1 / self.zoom_step
+        x_min, x_max, y_min, y_max = self.plane
+        self.plane = (c.real + (x_min - c.real) * factor, c.real + (x_max - c.real) * factor,
+                      c.imag + (y_min - c.imag) * factor, c.imag + (y_max - c.imag) * factor)
+        self.draw()
+
+    def close(self): # --- ウィンドウを閉じる（描画スレッドを止める） ---
+        self.render_worker.stop()
+        self.render_worker.join() # 計算中のバンドを待つ（MainWindowがこの後でプロセスプールを閉じても、閉じたプールにバンドを出さない）
+        self.after_cancel(self.poll_id)
+        self.destroy()
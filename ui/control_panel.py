@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
-from core import color_map
+from core import color_map, fractal
 
 class ControlPanel(ttk.Frame): # --- ControlPanelクラスの定義 ---
     def __init__(self, parent, main_window): # --- ControlPanelクラスのコンストラクタの定義 ---
@@ -73,6 +73,34 @@ class ControlPanel(ttk.Frame): # --- ControlPanelクラスの定義 ---
 #        bg_color_entry.bind('<FocusOut>', lambda e: self.on_color_change_bg(e, force=True))
 #        ttk.Button(bg_color_frame, text="選択", command=lambda: self.choose_color('bg')).pack(side=tk.LEFT)
 
+        # 計算方式の選択（active: 全ピクセルを計算、mariani_silver: 境界が一様な長方形を塗りつぶす）
+        ttk.Label(self, text="計算方式:").pack()
+        solver_combo = ttk.Combobox(self, textvariable=self.main_window.solver, values=fractal.SOLVERS, state='readonly', width=16)
+        solver_combo.pack()
+        solver_combo.bind('<<ComboboxSelected>>', self.on_solver_change) # 選択されたら描き直す
+
+        # 計算の精度の選択（complex64 は作業メモリが小さく速い。深く拡大すると自動的に complex128 で計算する）
+        ttk.Label(self, text="精度:").pack()
+        precision_combo = ttk.Combobox(self, textvariable=self.main_window.precision, values=fractal.PRECISIONS, state='readonly', width=16)
+        precision_combo.pack()
+        precision_combo.bind('<<ComboboxSelected>>', self.on_precision_change) # 選択されたら描き直す
+
+        # 段階描画のチェックボックス（オンなら更新ボタンを押さなくても完全描画まで自動で進む）
+        ttk.Checkbutton(self, text="段階描画", variable=self.main_window.progressive, command=self.on_progressive_change).pack(pady=5)
+
+        # アンチエイリアスの設定（完全描画の後に、隣と値が大きく違うピクセルだけをずらした点で追加計算する）
+        ttk.Checkbutton(self, text="アンチエイリアス", variable=self.main_window.antialias, command=self.on_antialias_change).pack()
+        ttk.Label(self, text="追加サンプル上限(%):").pack()
+        vcmd = (self.register(self.validate_aa_budget), '%P')
+        aa_spinbox = ttk.Spinbox(self, from_=1, to=400, increment=5, textvariable=self.main_window.aa_budget, width=6,
+                                 validate='key', validatecommand=vcmd, command=self.on_antialias_change)
+        aa_spinbox.pack(pady=(0, 5))
+        aa_spinbox.bind('<Return>', lambda e: self.on_antialias_change())
+        aa_spinbox.bind('<FocusOut>', lambda e: self.on_antialias_change())
+
+        # パラメータ平面のアトラス（c ごとのサムネイルを並べたウィンドウ。クリックでその c を読み込む）
+        ttk.Button(self, text="アトラス", command=self.main_window.open_atlas).pack(pady=(10, 0))
+
         # 更新ボタン
         ttk.Button(self, text="更新", command=self.full_draw).pack(pady=10)
 
@@ -103,6 +131,10 @@ class ControlPanel(ttk.Frame): # --- ControlPanelクラスの定義 ---
         except ValueError:
             return False  # 変換できなければ無効
 
+    def validate_aa_budget(self, value): # --- 追加サンプル上限の入力値を検証するメソッド ---
+        if not value: return True # 空文字列は許可（入力途中として有効）
+        return value.isdigit() # 0以上の整数なら有効
+
     def validate_start_color(self, color_hex): # --- 開始色の入力値を16進数形式で検証するメソッド ---
         if not color_hex: return True # 空文字列は許可（未入力として有効）
         if color_hex == "#": return True # "#"のみも許可（入力開始として有効）
@@ -186,6 +218,19 @@ class ControlPanel(ttk.Frame): # --- ControlPanelクラスの定義 ---
             }
             param_setters[color_type](selected_color)  # 該当する設定メソッドを呼び出して色を更新
 
+    def on_solver_change(self, event): # --- 計算方式が選択されたときに呼ばれるメソッド ---
+        self.main_window.quick_draw() # 新しい計算方式で描き直す
+
+    def on_precision_change(self, event): # --- 計算の精度が選択されたときに呼ばれるメソッド ---
+        self.main_window.quick_draw() # 新しい精度で描き直す
+
+    def on_progressive_change(self): # --- 段階描画のオン・オフが切り替えられたときに呼ばれるメソッド ---
+        self.main_window.quick_draw() # 新しいモードで描き直す
+
+    def on_antialias_change(self): # --- アンチエイリアスの設定が変更されたときに呼ばれるメソッド ---
+        self.main_window.aa_budget.set(self.main_window.antialias_budget()) # 空欄など整数として読めない場合は最後に読めた値に戻す
+        self.main_window.quick_draw() # 新しい設定で描き直す（アンチエイリアスは完全描画の後に行う）
+
     def full_draw(self): # --- 描画を更新 ---
         self.main_window.full_draw() # MainWindowの完全描画関数を呼び出す
 
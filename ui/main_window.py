@@ -1,9 +1,17 @@
+import os
+import time
 import tkinter as tk
+from decimal import Decimal, localcontext
 import numpy as np
-from tkinter import ttk
+from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 from .control_panel import ControlPanel
-from core import fractal, color_map
+from .render_worker import RenderWorker
+from .atlas_window import AtlasWindow
+from .profiler import Profiler, NULL_RECORD
+from core import fractal, color_map, antialias, perturbation, progressive, tile_cache
+from core.tile_renderer import TileRenderer
+from core.tile_cache import TileCache
 
 class MainWindow: # --- MainWindowのクラス定義 ---
     def __init__(self, root): # --- MainWindowクラスのコンストラクタの定義 ---
@@ -17,6 +25,18 @@ class MainWindow: # --- MainWindowのクラス定義 ---
         self.canvas_height = 720 # キャンバスの高さを720ピクセルに設定
         self.canvas = tk.Canvas(self.main_frame, width=self.canvas_width, height=self.canvas_height, bg='white') # Canvasクラスを使用してキャンバスを作成（背景色は白）
         self.canvas.pack(side=tk.LEFT) # キャンバスをメインフレームの左側に配置
+        # 表示用の画像はここで1つだけ作り、描画のたびに画素を書き換える
+        self.photo = ImageTk.PhotoImage('RGB', (self.canvas_width, self.canvas_height)) # キャンバスと同じ大きさのPhotoImage
+        self.canvas_image = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW) # 画像をキャンバスに配置（0, 0は原点で、画像の左上の座標。tk.NWは「North West（北西）」つまり左上に配置する
+        # 並列描画の設定（完全描画で使用）
+        self.render_workers = os.cpu_count() or 1 # ワーカープロセス数（1なら並列化しない）
+        self.tile_rows = 32 # 1つのタイル（行バンド）の行数
+        self.tile_renderer = TileRenderer(self.render_workers, self.tile_rows) # 行バンドを並列計算するレンダラー
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close) # ウィンドウを閉じるときにプロセスプールを解放する
+        # タイルキャッシュの設定（段階描画で使用。一度計算した場所に戻ったときは計算しない）
+        self.tile_cache = TileCache(tile_size=128, max_bytes=256 * 2**20, spill_dir=None) # spill_dirを指定すると追い出したタイルを .npy で保存する（max_spill_bytes まで）
+        self.atlas_window = None # パラメータ平面のアトラスのウィンドウ（開いていなければNone）
+        self.colorizer = color_map.Colorizer() # 色付け用のバッファを使い回す（描画スレッドだけで使う）
 
         # パラメータの初期値をここで一元管理
         self.initial_params = {
@@ -35,12 +55,18 @@ class MainWindow: # --- MainWindowのクラス定義 ---
         self.start_color = tk.StringVar(value=self.initial_params['start_color'])
         self.end_color = tk.StringVar(value=self.initial_params['end_color'])
 #        self.bg_color = tk.StringVar(value=self.initial_params['bg_color'])
+        self.progressive = tk.BooleanVar(value=True) # 段階描画（8→4→2→1ピクセル間隔で自動的に完全描画まで進める）
+        self.solver = tk.StringVar(value=fractal.SOLVERS[0]) # 完全描画の計算方式（fractal.SOLVERS のどれか）
+        self.precision = tk.StringVar(value=fractal.PRECISIONS[0]) # 計算の精度（fractal.PRECISIONS のどれか。深く拡大すると complex128 に切り替える）
+        self.antialias = tk.BooleanVar(value=False) # 完全描画の後に境界のピクセルだけアンチエイリアスする
+        self.aa_budget = tk.IntVar(value=int(antialias.DEFAULT_BUDGET * 100)) # アンチエイリアスの追加サンプル数の上限（ピクセル数に対する%）
+        self.last_aa_budget = self.aa_budget.get() # 最後に読めた上限（入力欄が空のあいだはこれを使う）
 
-        # ビュー範囲の初期値
-        self.view_x_min = -2.0 # ビューのX軸最小値を-2.0に設定
-        self.view_x_max = 2.0 # ビューのX軸最大値を2.0に設定
-        self.view_y_min = -2.0 # ビューのY軸最小値を-2.0に設定
-        self.view_y_max = 2.0 # ビューのY軸最大値を2.0に設定
+        # ビュー範囲の初期値（深く拡大しても桁が足りなくならないようにDecimalで持つ）
+        self.view_x_min = Decimal('-2.0') # ビューのX軸最小値を-2.0に設定
+        self.view_x_max = Decimal('2.0') # ビューのX軸最大値を2.0に設定
+        self.view_y_min = Decimal('-2.0') # ビューのY軸最小値を-2.0に設定
+        self.view_y_max = Decimal('2.0') # ビューのY軸最大値を2.0に設定
         # 初期値を辞書型（キーと値のペアでデータを管理する形式）で保存
         self.initial_view = {
             'x_min': -2.0, # 初期のX軸最小値
@@ -48,6 +74,7 @@ class MainWindow: # --- MainWindowのクラス定義 ---
             'y_min': -2.0, # 初期のY軸最小値
             'y_max': 2.0 # 初期のY軸最大値
         }
+        self.zoom_step = 0.9 # マウスホイール1段あたりの倍率
         # マウスイベントのバインド（検知）と対応する関数の呼び出し設定
         self.canvas.bind('<MouseWheel>', self.on_mousewheel) # マウスホイールを検知したらon_mousewheel関数を呼び出す
         self.canvas.bind('<Button-4>', self.on_mousewheel) # マウスホイール上回転を検知したらon_mousewheel関数を呼び出す（Linux用）
@@ -60,6 +87,16 @@ class MainWindow: # --- MainWindowのクラス定義 ---
         # コントロールパネルの設定 (ControlPanelクラスを使用)
         self.control_panel = ControlPanel(self.main_frame, self) # MainWindowを親としてControlPanelを作成
         self.control_panel.pack(side=tk.RIGHT, fill=tk.Y) # コントロールパネルをメインフレームの右側に配置
+        # バックグラウンド描画の設定（入力イベントはTkスレッドで即座に処理し、計算は別スレッドで行う）
+        self.poll_interval = 16 # 完成したフレームを確認する間隔（ミリ秒、約60Hz）
+        self.render_worker = RenderWorker(self._render_frame) # 最新の描画要求だけを計算するスレッド
+        self.render_worker.start() # スレッドを開始
+        # プロファイラの設定（F3でHUDの表示を切り替え、F4でトレースをJSONに書き出す。HUDを消している間は記録しない）
+        self.profiler = Profiler()
+        self.hud = None # HUDのキャンバスアイテム (背景, 文字)（最初に表示するときに作る）
+        self.root.bind('<F3>', self.toggle_profiler)
+        self.root.bind('<F4>', self.dump_trace)
+        self.root.after(self.poll_interval, self._poll_frame) # 完成したフレームの確認を開始
         # 初回描画
         self.quick_draw() # 初期状態で簡易描画を実行
 
@@ -69,57 +106,235 @@ class MainWindow: # --- MainWindowのクラス定義 ---
     def full_draw(self): # --- 完全描画の場合の処理 ---
         self._draw(quick=False)
 
-    def _draw(self, quick=False): # --- 描画処理の共通部分 ---
-        if quick: # 簡易描画の場合は間引く
+    def _draw(self, quick=False): # --- 描画処理の共通部分（描画要求を作ってバックグラウンドに渡す） ---
+        # Tkの変数はTkスレッドでしか読めないので、ここで現在のパラメータを写し取る
+        view = self._view()
+        job = {
+            'view': tuple(float(v) for v in view), # 通常の計算はfloat64の座標で行う
+            'deep_view': view, # 摂動法で計算するときの高精度の座標
+            'size': (self.canvas_width, self.canvas_height),
+            'real': self.real.get(), # 実部と虚部の値を入力フィールドから取得
+            'imag': self.imag.get(),
+            'max_iter': self.max_iter.get(), # 最大反復回数を入力フィールドから取得
+            'start_color': self.start_color.get(), # 開始色の値を入力フィールドから取得
+            'end_color': self.end_color.get(), # 終了色の値を入力フィールドから取得
+#            'bg_color': self.bg_color.get(), # 背景色の値を入力フィールドから取得
+            'quick': quick,
+            'progressive': self.progressive.get(), # 段階描画の有無
+            'solver': self.solver.get(), # 完全描画の計算方式
+            'precision': fractal.select_precision(self.precision.get(), view, (self.canvas_width, self.canvas_height)), # 拡大率に応じて実際に使う精度
+            'antialias': self.antialias_budget() / 100 if self.antialias.get() else 0.0, # 追加サンプル数の上限（0なら使わない）
+            'submitted': time.perf_counter(), # 要求を出した時刻（プロファイラが表示までの時間を計る）
+            'profile': self.profiler.enabled # この要求を記録するか（描画の途中でF3を押しても変わらない）
+        }
+        self.render_worker.submit(job) # 計算中の描画は取り消され、最新の要求だけが計算される
+
+    def antialias_budget(self): # --- アンチエイリアスの追加サンプル数の上限（%）を返す（入力欄が空などで読めなければ最後に読めた値） ---
+        try:
+            budget = int(self.aa_budget.get())
+        except (ValueError, tk.TclError): # 入力途中の空欄はControlPanelの検証で許している
+            return self.last_aa_budget
+        self.last_aa_budget = max(1, budget)
+        return self.last_aa_budget
+
+    def _render_frame(self, job, cancel): # --- 描画要求からRGB画像を順に計算する（RenderWorkerのスレッドで実行されるジェネレータ） ---
+        c = complex(job['real'], job['imag']) # 複素数パラメータ
+        if perturbation.needs_perturbation(job['deep_view'], job['size']): # float64では1ピクセルの幅を表せないほど拡大した場合
+            yield from self._render_deep(job, c, cancel)
+            return
+        if job['progressive']: # 段階描画の場合は粗い格子から順に計算して、段階ごとに表示する
+            x = np.linspace(job['view'][0], job['view'][1], job['size'][0]) # x軸の値を生成する
+            y = np.linspace(job['view'][2], job['view'][3], job['size'][1]) # y軸の値を生成する
+            tile_key = None # 格子上にないビューはタイルキャッシュを使わない
+            position = tile_cache.lattice_position(job['view'], self._base_view(), job['size'], self.zoom_step)
+            if position is not None: # タイルのキーは (c, 反復回数, 精度, 格子, 拡大段階, タイルの列, タイルの行)
+                level, kx, ky = position
+                tile_key = ((c, job['max_iter'], job['precision'], self._base_view(), job['size'], level), kx, ky)
+            stats = self.profiler.new_stats(job) # 段階ごとに各フレームの記録へ移す
+            record = self.profiler.begin(job, 'progressive')
+            for stride, samples in progressive.render_passes(self.tile_renderer, x, y, c, job['max_iter'], cancel=cancel,
+                                                             cache=self.tile_cache, tile_key=tile_key, solver=job['solver'], stats=stats,
+                                                             precision=job['precision']):
+                record.lap('kernel')
+                record.rename(f'stride {stride}')
+                record.take_stats(stats)
+                output = samples.copy() # 共有メモリの値は次の段階で使うのでコピーして正規化する
+                bounds = fractal.escape_bounds(output)
+                fractal.normalize(output, bounds)
+                record.lap('normalize')
+                yield self._to_image(output, job, stride, record)
+                record = self.profiler.begin(job, 'progressive') # 次の段階の記録（yield から戻った時点から計る）
+            if job['antialias'] > 0: # 完全な画像を表示してから境界のピクセルだけ追加計算する
+                yield self._antialiased_image(output, bounds, job, x, y, c, cancel, self.profiler.begin(job, 'antialias'))
+            return
+        if job['quick']: # 簡易描画の場合は間引く
             skip = 4
         else: # 完全描画の場合は間引かない
             skip = 1
-        # calculate_juliaに引数を渡して、結果をoutputに格納する
-        output = fractal.calculate_julia(
-            self.view_x_min, self.view_x_max,
-            self.view_y_min, self.view_y_max,
-            self.canvas_width, self.canvas_height,
-            self.real.get(), self.imag.get(), # 実部と虚部の値を入力フィールドから取得
-            self.max_iter.get(), skip # 最大反復回数と間引き回数を入力フィールドから取得
-        )
+        record = self.profiler.begin(job, 'quick' if job['quick'] else 'full')
+        # 簡易描画はcalculate_julia_active（アクティブセット方式）、完全描画はTileRenderer（並列計算）で計算し、結果をoutputに格納する
+        if job['quick']:
+            output = fractal.calculate_julia_active(
+                *job['view'], *job['size'],
+                job['real'], job['imag'],
+                job['max_iter'], skip, # 最大反復回数と間引き回数
+                cancel, # 新しい描画要求が来たら計算を打ち切る
+                record.stats, # プロファイラが有効なら計算量を記録する
+                job['precision'], self.tile_renderer.workspace # 作業用のバッファは描画スレッドでフレームをまたいで使い回す
+            )
+            record.lap('kernel') # 正規化も含む
+        else:
+            x = np.linspace(job['view'][0], job['view'][1], job['size'][0]) # x軸の値を生成する
+            y = np.linspace(job['view'][2], job['view'][3], job['size'][1]) # y軸の値を生成する
+            output = self.tile_renderer.render_raw(x, y, c, job['max_iter'], cancel, job['solver'], record.stats, job['precision']) # 選択した計算方式で並列計算する
+            record.lap('kernel')
+            bounds = fractal.escape_bounds(output) # アンチエイリアスの追加サンプルも同じ範囲で正規化する
+            fractal.normalize(output, bounds)
+            record.lap('normalize')
+        yield self._to_image(output, job, skip, record)
+        if not job['quick'] and job['antialias'] > 0: # 完全な画像を表示してから境界のピクセルだけ追加計算する
+            yield self._antialiased_image(output, bounds, job, x, y, c, cancel, self.profiler.begin(job, 'antialias'))
+
+    def _render_deep(self, job, c, cancel): # --- 深く拡大したビューを摂動法で計算する（RenderWorkerのスレッドで実行されるジェネレータ） ---
+        # 間引いた画像を先に表示してから完全な画像を計算する（非段階描画の簡易描画は間引いた画像だけ）
+        # 座標がfloat64で表せないので、タイルキャッシュ、パンの再利用、並列計算、計算方式の選択とアンチエイリアスは使わない
+        skips = (4,) if job['quick'] and not job['progressive'] else (4, 1)
+        for skip in skips:
+            record = self.profiler.begin(job, f'deep skip {skip}')
+            output = perturbation.perturbation_values(job['deep_view'], *job['size'], c, job['max_iter'], skip, cancel, record.stats)
+            record.lap('kernel')
+            fractal.normalize(output)
+            record.lap('normalize')
+            yield self._to_image(output, job, skip, record)
+
+    def _to_image(self, output, job, skip, record=NULL_RECORD): # --- 正規化済みの値にカラーマップを適用して画像に変換する ---
+        # record に FrameRecord を渡すと段階ごとの時間を記録し、画像の info['profile'] に付けてTkスレッドへ渡す
         # カラーマップの適用 (color_mapモジュールの関数を使用)
         colors = color_map.create_colormap(
             output,
-            self.start_color.get(), # 開始色の値を入力フィールドから取得
-            self.end_color.get(), # 終了色の値を入力フィールドから取得
-#            self.bg_color.get() # 背景色の値を入力フィールドから取得
+            job['start_color'], # 開始色
+            job['end_color'], # 終了色
+#            job['bg_color'] # 背景色
+            self.colorizer # 出力用のバッファを使い回す
         )
-        # 画像の拡大 (簡易描画時のみ)
-        if quick: # 簡易描画の場合
-            if len(colors.shape) != 3:
-                raise ValueError(f"Invalid colors shape: {colors.shape}, expected (height, width, 3)")
-            colors_resized = np.repeat(np.repeat(colors, skip, axis=0), skip, axis=1) # 1ピクセルを縦横skip倍のブロックに拡大（np.repeatはNumPyの関数で、配列の要素を指定した回数だけ繰り返す）
-            img = Image.fromarray(colors_resized) # PIL（Python Imaging Library）のImage.fromarrayで画像オブジェクトに変換
-        else: # 完全描画の場合はそのまま
-            img = Image.fromarray(colors) # PIL（Python Imaging Library）のImage.fromarrayで画像オブジェクトに変換
-        self.photo = ImageTk.PhotoImage(image=img) # imgをTkinterで使える形式（PhotoImage形式）に変換
-        self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW) # 画像をキャンバスに描画（0, 0は原点で、画像の左上の座標。tk.NWは「North West（北西）」つまり左上に配置する
+        if len(colors.shape) != 3:
+            raise ValueError(f"Invalid colors shape: {colors.shape}, expected (height, width, 3)")
+        record.lap('colormap')
+        img = Image.fromarray(colors) # PIL（Python Imaging Library）のImage.fromarrayで画像オブジェクトに変換
+        # 画像の拡大 (間引いて計算した場合のみ)
+        if skip > 1: # 間引いている場合
+            width, height = job['size']
+            # 最近傍補間で1ピクセルを縦横skip倍のブロックに拡大（boxで元画像の範囲を指定し、割り切れない場合もはみ出さないようにする）
+            img = img.resize((width, height), Image.NEAREST, box=(0, 0, width / skip, height / skip))
+        record.lap('image')
+        if record is not NULL_RECORD:
+            img.info['profile'] = record
+        return img
+
+    def _antialiased_image(self, output, bounds, job, x, y, c, cancel, record=NULL_RECORD): # --- 正規化済みの値を色付けし、境界のピクセルだけ追加計算して平均した画像を作る ---
+        colors_hex = color_map.gradient_colors(job['start_color'], job['end_color'])
+        colors = color_map.create_colormap(output, *colors_hex, self.colorizer)
+        record.lap('colormap')
+        antialias.antialias(colors, output, bounds, x, y, c, job['max_iter'], colors_hex, budget=job['antialias'], cancel=cancel, stats=record.stats,
+                            precision=job['precision'], workspace=self.tile_renderer.workspace) # 描画スレッドの作業用バッファを使い回す
+        record.lap('antialias')
+        img = Image.fromarray(colors)
+        record.lap('image')
+        if record is not NULL_RECORD:
+            img.info['profile'] = record
+        return img
+
+    def _poll_frame(self): # --- 完成したフレームを定期的に受け取ってキャンバスに表示する（Tkスレッドで実行） ---
+        img = self.render_worker.take_result() # 最新のフレームだけを受け取る（途中のフレームは捨てられている）
+        if img is not None:
+            record = img.info.get('profile') # プロファイラが有効なときに描画スレッドが付けた記録
+            if record is not None:
+                record.restart()
+            self.photo.paste(img) # 起動時に作ったPhotoImageの画素をその場で書き換える（キャンバスのアイテムは増えない）
+            if record is not None:
+                record.lap('paste')
+                self.profiler.displayed(record, self.render_worker.counters)
+                self._update_hud()
+        self.root.after(self.poll_interval, self._poll_frame) # 次の確認を予約する
+
+    def toggle_profiler(self, event=None): # --- プロファイラとHUDの表示を切り替える（F3） ---
+        self.profiler.enabled = not self.profiler.enabled
+        if self.hud is None: # 左上に半透明風の黒い背景と文字を置く
+            background = self.canvas.create_rectangle(0, 0, 0, 0, fill='black', outline='', stipple='gray75')
+            text = self.canvas.create_text(8, 8, anchor=tk.NW, fill='white', font=('TkFixedFont', 9))
+            self.hud = (background, text)
+        state = tk.NORMAL if self.profiler.enabled else tk.HIDDEN
+        for item in self.hud:
+            self.canvas.itemconfigure(item, state=state)
+        if self.profiler.enabled:
+            self._update_hud()
+
+    def _update_hud(self): # --- HUDの文字を最新のフレームの記録に書き換える ---
+        if self.hud is None or not self.profiler.enabled:
+            return
+        background, text = self.hud
+        self.canvas.itemconfigure(text, text=self.profiler.summary())
+        x0, y0, x1, y1 = self.canvas.bbox(text)
+        self.canvas.coords(background, x0 - 4, y0 - 4, x1 + 4, y1 + 4)
+
+    def dump_trace(self, event=None): # --- プロファイラの記録をカレントディレクトリにトレースファイルとして書き出す（F4） ---
+        path = time.strftime('trace-%Y%m%d-%H%M%S.json')
+        try:
+            count = self.profiler.dump(path)
+        except OSError as e: # 書き込めない場所で起動した場合など
+            messagebox.showerror("トレースの書き出し", f"{path} を書き出せませんでした: {e}", parent=self.root)
+            return
+        messagebox.showinfo("トレースの書き出し", f"{count} フレームの記録を {os.path.abspath(path)} に書き出しました", parent=self.root)
+
+    def _view(self): # --- 現在のビュー範囲を (x_min, x_max, y_min, y_max) のDecimalで返す ---
+        return (self.view_x_min, self.view_x_max, self.view_y_min, self.view_y_max)
+
+    def _base_view(self): # --- タイルキャッシュの格子の基準になる初期ビューを返す ---
+        return (self.initial_view['x_min'], self.initial_view['x_max'], self.initial_view['y_min'], self.initial_view['y_max'])
+
+    def open_atlas(self): # --- パラメータ平面のアトラスのウィンドウを開く（開いていれば前面に出す） ---
+        if self.atlas_window is not None and self.atlas_window.winfo_exists():
+            self.atlas_window.lift()
+            return
+        self.atlas_window = AtlasWindow(self)
+
+    def on_close(self): # --- ウィンドウを閉じるときの処理 ---
+        if self.atlas_window is not None and self.atlas_window.winfo_exists():
+            self.atlas_window.close() # アトラスの描画スレッドも止める
+        self.render_worker.stop() # 描画スレッドを止める
+        self.render_worker.join() # 計算中の描画が取り消されるのを待つ
+        self.tile_renderer.close() # プロセスプールと共有メモリを解放する
+        self.root.destroy() # ウィンドウを破棄する
 
     def on_mousewheel(self, event): # --- イベントハンドラ（マウス操作） ---
         # マウスの座標を取得
         canvas_x = self.canvas.winfo_pointerx() - self.canvas.winfo_rootx()
         canvas_y = self.canvas.winfo_pointery() - self.canvas.winfo_rooty()
-        # マウスの座標を複素数に変換
-        complex_x = self.view_x_min + (self.view_x_max - self.view_x_min) * (canvas_x / self.canvas_width)
-        complex_y = self.view_y_min + (self.view_y_max - self.view_y_min) * (canvas_y / self.canvas_height)
-        # ズームイン/アウトの処理
-        if event.num == 4 or event.delta > 0: # ホイール上回転
-            zoom_factor = 0.9 # ズームイン
-        else: # ホイール下回転
-            zoom_factor = 1.1 # ズームアウト
-        # 倍率に応じてビュー範囲を更新
-        width = (self.view_x_max - self.view_x_min) * zoom_factor # 幅の計算
-        height = (self.view_y_max - self.view_y_min) * zoom_factor # 高さの計算
-        # マウス位置を新しい中心にして表示範囲をずらす
-        self.view_x_min = complex_x - width * (canvas_x / self.canvas_width)
-        self.view_x_max = complex_x + width * (1 - canvas_x / self.canvas_width)
-        self.view_y_min = complex_y - height * (canvas_y / self.canvas_height)
-        self.view_y_max = complex_y + height * (1 - canvas_y / self.canvas_height)
+        size = (self.canvas_width, self.canvas_height)
+        with localcontext() as ctx: # ビューの幅に合わせた桁数で計算する
+            ctx.prec = perturbation.precision(self._view(), size)
+            # マウスの座標を複素数に変換
+            fx = Decimal(canvas_x) / self.canvas_width # キャンバス上の位置の割合
+            fy = Decimal(canvas_y) / self.canvas_height
+            complex_x = self.view_x_min + (self.view_x_max - self.view_x_min) * fx
+            complex_y = self.view_y_min + (self.view_y_max - self.view_y_min) * fy
+            # ズームイン/アウトの処理
+            if event.num == 4 or event.delta > 0: # ホイール上回転
+                zoom_factor = Decimal(self.zoom_step) # ズームイン
+            else: # ホイール下回転
+                zoom_factor = 1 / Decimal(self.zoom_step) # ズームアウト（ズームインのちょうど逆にして、同じ拡大段階に戻れるようにする）
+            # 倍率に応じてビュー範囲を更新
+            width = (self.view_x_max - self.view_x_min) * zoom_factor # 幅の計算
+            height = (self.view_y_max - self.view_y_min) * zoom_factor # 高さの計算
+            # マウス位置を新しい中心にして表示範囲をずらす
+            self.view_x_min = complex_x - width * fx
+            self.view_x_max = complex_x + width * (1 - fx)
+            self.view_y_min = complex_y - height * fy
+            self.view_y_max = complex_y + height * (1 - fy)
+        if not perturbation.needs_perturbation(self._view(), size): # float64で計算できる範囲では
+            # ビューを拡大段階ごとの格子に揃える（半ピクセル未満のずれ。タイルキャッシュを使えるようにする）
+            snapped = tile_cache.snap_view(tuple(float(v) for v in self._view()), self._base_view(), size, self.zoom_step)
+            self.view_x_min, self.view_x_max, self.view_y_min, self.view_y_max = (Decimal(v) for v in snapped)
         # 簡易描画
         self.quick_draw()
 
@@ -134,17 +349,19 @@ class MainWindow: # --- MainWindowのクラス定義 ---
         # ドラッグ距離を計算（現在のマウス位置とパンの開始位置の差）
         dx = event.x - self.pan_start_x
         dy = event.y - self.pan_start_y
-        # スケールを計算（キャンバスのピクセル数に対するビュー範囲の比率）
-        x_scale = (self.view_x_max - self.view_x_min) / self.canvas_width
-        y_scale = (self.view_y_max - self.view_y_min) / self.canvas_height
-        # ドラッグ距離をビュー範囲のスケールに変換（移動量を複素平面に適用）
-        dx_complex = -dx * x_scale
-        dy_complex = -dy * y_scale
-        # ビュー範囲を更新（ドラッグに応じて全体を移動）
-        self.view_x_min += dx_complex
-        self.view_x_max += dx_complex
-        self.view_y_min += dy_complex
-        self.view_y_max += dy_complex
+        with localcontext() as ctx: # ビューの幅に合わせた桁数で計算する
+            ctx.prec = perturbation.precision(self._view(), (self.canvas_width, self.canvas_height))
+            # スケールを計算（1ピクセルあたりのビュー範囲。linspaceの点の間隔に合わせて整数ピクセルの移動にする）
+            x_scale = (self.view_x_max - self.view_x_min) / (self.canvas_width - 1)
+            y_scale = (self.view_y_max - self.view_y_min) / (self.canvas_height - 1)
+            # ドラッグ距離をビュー範囲のスケールに変換（移動量を複素平面に適用）
+            dx_complex = -dx * x_scale
+            dy_complex = -dy * y_scale
+            # ビュー範囲を更新（ドラッグに応じて全体を移動）
+            self.view_x_min += dx_complex
+            self.view_x_max += dx_complex
+            self.view_y_min += dy_complex
+            self.view_y_max += dy_complex
         # パンの開始位置を現在のマウス位置に更新
         self.pan_start_x = event.x # パンの開始位置 (x座標)
         self.pan_start_y = event.y # パンの開始位置 (y座標)
@@ -152,10 +369,10 @@ class MainWindow: # --- MainWindowのクラス定義 ---
         self.quick_draw()
 
     def reset_view(self): # --- ビュー範囲を初期状態に戻す（ControlPanelに移動しても良い） ---
-        self.view_x_min = self.initial_view['x_min']
-        self.view_x_max = self.initial_view['x_max']
-        self.view_y_min = self.initial_view['y_min']
-        self.view_y_max = self.initial_view['y_max']
+        self.view_x_min = Decimal(self.initial_view['x_min'])
+        self.view_x_max = Decimal(self.initial_view['x_max'])
+        self.view_y_min = Decimal(self.initial_view['y_min'])
+        self.view_y_max = Decimal(self.initial_view['y_max'])
         # 簡易描画
         self.quick_draw()
 
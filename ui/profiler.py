@@ -0,0 +1,126 @@
+import json
+import time
+from collections import deque
+
+# 描画の各段階の時間を計るプロファイラ
+# 描画スレッドがフレームごとに FrameRecord に段階の時間と計算量を記録し、画像と一緒にTkスレッドへ渡す
+# Tkスレッドは表示した時刻を加えてリングバッファに入れ、HUDに表示したり、Chromeのトレース形式（chrome://tracing, Perfetto）で書き出したりする
+# 無効なときは何もしない NULL_RECORD を返し、カーネルにも stats を渡さないので、描画の負担はほぼない
+
+SPARK = ' ▁▂▃▄▅▆▇█' # 反復ごとの生きているピクセル数のグラフに使う文字
+SPARK_WIDTH = 48 # グラフの文字数
+
+class FrameRecord: # --- 1つのフレームの段階ごとの時間と計算量を記録するクラス ---
+    __slots__ = ('label', 'submitted', 'stages', 'stats', 'shown', 'counters', '_lap')
+
+    def __init__(self, label, submitted): # --- FrameRecordクラスのコンストラクタの定義 ---
+        self.label = label # フレームの種類（'quick', 'stride 4' など）
+        self.submitted = submitted # 描画要求を出した時刻（time.perf_counter）
+        self.stages = [] # (段階の名前, 開始時刻, 所要時間) のリスト
+        self.stats = {'live_pixels': []} # カーネルに渡す計算量の辞書（反復ごとの生きているピクセル数も数える）
+        self.shown = None # 表示を終えた時刻
+        self.counters = None # 表示した時点の RenderWorker の counters
+        self._lap = time.perf_counter() # 今の段階の開始時刻
+
+    def lap(self, name): # --- 前の lap からの時間を name の段階として記録するメソッド ---
+        now = time.perf_counter()
+        self.stages.append((name, self._lap, now - self._lap))
+        self._lap = now
+
+    def restart(self): # --- 記録しない時間（yield で待っていた時間など）を飛ばすメソッド ---
+        self._lap = time.perf_counter()
+
+    def rename(self, label): # --- 計算してから種類が分かったフレームの名前を付け直すメソッド ---
+        self.label = label
+
+    def take_stats(self, stats): # --- 複数のフレームで使い回している stats の中身を受け取り、stats を空に戻すメソッド ---
+        self.stats = dict(stats)
+        stats.clear()
+        stats['live_pixels'] = []
+
+    def render_time(self): # --- 描画スレッドでかかった時間（表示を除く段階の合計）を返すメソッド ---
+        return sum(duration for name, start, duration in self.stages if name != 'paste')
+
+    def ready(self): # --- 描画スレッドが画像を作り終えた時刻を返すメソッド ---
+        return max((start + duration for name, start, duration in self.stages if name != 'paste'), default=self.submitted)
+
+class NullRecord: # --- プロファイラが無効なときの何もしない FrameRecord ---
+    __slots__ = ()
+    stats = None # カーネルには stats=None を渡す（計算量を数えない）
+
+    def lap(self, name):
+        pass
+
+    def restart(self):
+        pass
+
+    def rename(self, label):
+        pass
+
+    def take_stats(self, stats):
+        pass
+
+NULL_RECORD = NullRecord()
+
+class Profiler: # --- フレームの記録をリングバッファに集めるクラス ---
+    def __init__(self, capacity=256): # --- Profilerクラスのコンストラクタの定義 ---
+        self.enabled = False # 無効なら begin() は NULL_RECORD を返す（描画要求の 'profile' があればそちらを使う）
+        self.frames = deque(maxlen=capacity) # 表示したフレームの記録（古いものから捨てる）
+        self.origin = time.perf_counter() # トレースの時刻の基準
+
+    def recording(self, job): # --- 描画要求を記録するかを返すメソッド ---
+        # 要求を出したときに決めた job['profile'] を使う（描画の途中でF3を押しても、1つの要求の中では変わらない）
+        return job.get('profile', self.enabled)
+
+    def begin(self, job, label): # --- 1つのフレームの記録を始めるメソッド（描画スレッドから呼ぶ） ---
+        if not self.recording(job):
+            return NULL_RECORD
+        return FrameRecord(label, job.get('submitted', time.perf_counter()))
+
+    def new_stats(self, job): # --- 複数のフレームで使い回す stats を返すメソッド（記録しない要求ならNone） ---
+        return {'live_pixels': []} if self.recording(job) else None
+
+    def displayed(self, record, counters): # --- 表示を終えたフレームをリングバッファに入れるメソッド（Tkスレッドから呼ぶ） ---
+        record.shown = time.perf_counter()
+        record.counters = dict(counters)
+        self.frames.append(record)
+
+    def summary(self): # --- HUDに表示する文字列を返すメソッド ---
+        if not self.frames:
+            return "profiler: waiting for a frame"
+        record = self.frames[-1]
+        stages = {} # 同じ名前の段階は合計する
+        for name, start, duration in record.stages:
+            stages[name] = stages.get(name, 0) + duration
+        live = record.stats.get('live_pixels', [])
+        lines = [
+            f"{record.label}  render {record.render_time() * 1000:.1f} ms  latency {(record.shown - record.submitted) * 1000:.1f} ms",
+            "  ".join(f"{name} {duration * 1000:.1f}" for name, duration in stages.items()),
+            f"live {sparkline(live)}  {len(live)} iter  {record.stats.get('pixel_iterations', 0) / 1e6:.1f}M px-it",
+            "  ".join(f"{key} {value}" for key, value in record.counters.items())
+            + f"  poll lag {(record.shown - record.ready() - stages.get('paste', 0)) * 1000:.1f} ms",
+        ]
+        return "\n".join(lines)
+
+    def dump(self, path): # --- リングバッファの記録をChromeのトレース形式のJSONで書き出すメソッド ---
+        events = []
+        for record in self.frames:
+            for name, start, duration in record.stages: # 段階ごとの区間（表示はTkスレッド、それ以外は描画スレッド）
+                events.append({'name': name, 'cat': record.label, 'ph': 'X', 'pid': 1, 'tid': 'tk' if name == 'paste' else 'render',
+                               'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6})
+            events.append({'name': record.label, 'cat': 'frame', 'ph': 'X', 'pid': 1, 'tid': 'frame', # 要求から表示までの区間
+                           'ts': (record.submitted - self.origin) * 1e6, 'dur': (record.shown - record.submitted) * 1e6,
+                           'args': {key: value for key, value in record.stats.items()}})
+            events.append({'name': 'render worker', 'ph': 'C', 'pid': 1, 'ts': (record.shown - self.origin) * 1e6,
+                           'args': record.counters})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(self.frames)
+
+def sparkline(values, width=SPARK_WIDTH): # --- 値の列を width 文字以内のグラフにする関数（各文字は区間の最大値） ---
+    if not values:
+        return ""
+    step = -(-len(values) // width)
+    bins = [max(values[i:i + step]) for i in range(0, len(values), step)]
+    top = max(bins) or 1
+    return "".join(SPARK[-(-value * (len(SPARK) - 1) // top)] for value in bins)
@@ -0,0 +1,62 @@
+import threading
+import traceback
+from core import fractal
+
+class RenderWorker(threading.Thread): # --- 最新の描画要求だけをバックグラウンドで計算するスレッド ---
+    def __init__(self, render_func): # --- RenderWorkerクラスのコンストラクタの定義 ---
+        super().__init__(daemon=True) # ウィンドウを閉じたらスレッドも終わるようにデーモンにする
+        self.render_func = render_func # 描画要求を受け取ってフレームを順に返すジェネレータ関数 render_func(job, cancel)
+        self._cond = threading.Condition() # 要求と結果を守るロック兼待ち合わせ
+        self._job = None # まだ処理していない最新の描画要求（古い要求は上書きされる）
+        self._generation = 0 # 描画要求の世代番号（新しい要求が来るたびに増える）
+        self._result = None # Tkスレッドに渡す最新のフレーム
+        self._stopped = False # スレッドを止めるかどうか
+        # 捨てた要求とフレームの数（プロファイラが表示する。ロックの中で数えるだけなので常に有効）
+        # coalesced: 処理する前に新しい要求で上書きした要求、dropped: 表示される前に新しいフレームで上書きしたフレーム、cancelled: 計算中に取り消した描画
+        self.counters = {'coalesced': 0, 'dropped': 0, 'cancelled': 0}
+
+    def submit(self, job): # --- 描画要求を登録する（Tkスレッドから呼ぶ）メソッド ---
+        with self._cond:
+            self._generation += 1 # 世代を進めると計算中の描画は取り消される
+            if self._job is not None:
+                self.counters['coalesced'] += 1
+            self._job = job # 未処理の要求は最新のものだけを残す（イベントをまとめる）
+            self._cond.notify() # 待機中のスレッドを起こす
+
+    def take_result(self): # --- 完成したフレームを取り出す（Tkスレッドから呼ぶ）メソッド ---
+        with self._cond:
+            result, self._result = self._result, None # 取り出したら空にする
+            return result
+
+    def stop(self): # --- スレッドを止めるメソッド ---
+        with self._cond:
+            self._stopped = True
+            self._generation += 1 # 計算中の描画も取り消す
+            self._cond.notify()
+
+    def run(self): # --- スレッドの本体 ---
+        while True:
+            with self._cond:
+                while self._job is None and not self._stopped: # 要求が来るまで待つ
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job, generation = self._job, self._generation # 最新の要求とその世代を取り出す
+                self._job = None
+            cancel = lambda: self._generation != generation # 世代が変わったら取り消す
+            try:
+                for frame in self.render_func(job, cancel): # フレームができるたびにTkスレッドへ渡す（段階描画では複数回）
+                    with self._cond:
+                        if generation != self._generation: # 計算中に新しい要求が来ていたら結果は捨てる
+                            self.counters['cancelled'] += 1
+                            break
+                        if self._result is not None:
+                            self.counters['dropped'] += 1
+                        self._result = frame # 表示されていない古いフレームは上書きする
+            except fractal.RenderCancelled: # 新しい要求が来て取り消された場合は次の要求へ
+                with self._cond:
+                    self.counters['cancelled'] += 1
+                continue
+            except Exception: # 描画に失敗してもスレッドは止めない（Tkのコールバックと同じくエラーを表示するだけ）
+                traceback.print_exc()
+                continue